@@ -0,0 +1,90 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from time_tracker_app import DatabaseManager
+
+
+class DeleteActivityTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self._tmp_dir.name, 'test.db'))
+
+    def tearDown(self):
+        self.db.close()
+        self._tmp_dir.cleanup()
+
+    def _activities(self):
+        return self.db.conn.execute("SELECT id, name, parent_id FROM activities ORDER BY id").fetchall()
+
+    def test_delete_branch_with_child_named_like_top_level_activity(self):
+        # Work > Email plus a top-level Email: ON DELETE SET NULL must not move the child Email
+        # to the top level (and clash with the unique name index) while the branch is deleted
+        work_id = self.db.add_activity('Work')
+        self.db.add_activity('Email', work_id)
+        top_email_id = self.db.add_activity('Email')
+
+        self.assertTrue(self.db.delete_activity(work_id))
+        self.assertEqual(self._activities(), [(top_email_id, 'Email', None)])
+
+    def test_delete_branch_removes_all_descendants_and_entries(self):
+        work_id = self.db.add_activity('Work')
+        project_id = self.db.add_activity('Project', work_id)
+        task_id = self.db.add_activity('Task', project_id)
+        other_id = self.db.add_activity('Other')
+        self.db.add_time_entry(task_id, 60)
+        self.db.add_time_entry(other_id, 30)
+
+        self.assertTrue(self.db.delete_activity(work_id))
+        self.assertEqual(self._activities(), [(other_id, 'Other', None)])
+        self.assertEqual(self.db.conn.execute("SELECT activity_id FROM time_entries").fetchall(), [(other_id,)])
+
+
+class AddTimeEntriesTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self._tmp_dir.name, 'test.db'))
+
+    def tearDown(self):
+        self.db.close()
+        self._tmp_dir.cleanup()
+
+    def test_returns_only_the_rows_actually_inserted(self):
+        work_id = self.db.add_activity('Work')
+        valid_work = (work_id, 60, None, 'work', 1.0)
+        negative = (work_id, -5, None, 'work', 1.0) # Skipped by validation
+        valid_break = (work_id, 30, None, 'break', 1.0)
+
+        saved_rows = self.db.add_time_entries([valid_work, negative, valid_break])
+
+        self.assertEqual(saved_rows, [valid_work, valid_break])
+        self.assertEqual(self.db.conn.execute("SELECT COUNT(*) FROM time_entries").fetchone()[0], 2)
+
+
+class AverageEntryDurationTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self._tmp_dir.name, 'test.db'))
+
+    def tearDown(self):
+        self.db.close()
+        self._tmp_dir.cleanup()
+
+    def test_average_covers_only_the_activity_and_follows_new_entries(self):
+        work_id = self.db.add_activity('Work')
+        child_id = self.db.add_activity('Child', work_id)
+        self.assertEqual(self.db.get_average_entry_duration(work_id), 0)
+
+        self.db.add_time_entry(work_id, 60)
+        self.db.add_time_entry(child_id, 600)
+        self.assertEqual(self.db.get_average_entry_duration(work_id), 60)
+
+        self.db.add_time_entry(work_id, 120) # Invalidates the cached average
+        self.assertEqual(self.db.get_average_entry_duration(work_id), 90)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt6.QtCore import QItemSelectionModel
+from PyQt6.QtWidgets import QApplication, QMessageBox
+
+import time_tracker_app
+from time_tracker_app import MainWindow, PostSessionReviewDialog
+
+app = QApplication.instance() or QApplication(sys.argv[:1])
+
+
+class DeleteRunningActivityTest(unittest.TestCase):
+    def setUp(self):
+        # MainWindow opens DATABASE_NAME in the working directory
+        self._old_cwd = os.getcwd()
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp_dir.name)
+        self.window = MainWindow()
+
+    def tearDown(self):
+        self.window.qtimer.stop()
+        self.window.db_manager.close()
+        self.window.deleteLater()
+        app.processEvents()
+        os.chdir(self._old_cwd)
+        self._tmp_dir.cleanup()
+
+    def _select(self, activity_id):
+        index = self.window._activity_model.index_for_id(activity_id)
+        self.window.activity_tree.selectionModel().select(
+            index, QItemSelectionModel.SelectionFlag.ClearAndSelect | QItemSelectionModel.SelectionFlag.Rows)
+
+    def test_delete_activity_with_running_timer(self):
+        db = self.window.db_manager
+        activity_id = db.add_activity('Work')
+        self.window.load_activities()
+        self._select(activity_id)
+        self.window.start_selected_tasks()
+        timer_window = self.window.active_timer_windows[activity_id]['window']
+
+        with mock.patch.object(time_tracker_app.QMessageBox, 'question', return_value=QMessageBox.StandardButton.Yes), \
+             mock.patch.object(PostSessionReviewDialog, 'exec') as review_exec:
+            self.window.delete_activity_action(activity_id)
+
+        review_exec.assert_not_called() # The session of a deleted activity is discarded, not reviewed
+        self.assertNotIn(activity_id, self.window.active_timer_windows)
+        self.assertFalse(timer_window.isVisible())
+        self.assertFalse(self.window.qtimer.isActive())
+        self.assertEqual(db.conn.execute("SELECT COUNT(*) FROM activities").fetchone()[0], 0)
+        self.assertEqual(db.conn.execute("SELECT COUNT(*) FROM time_entries").fetchone()[0], 0)
+
+
+class PostSessionReviewSaveTest(unittest.TestCase):
+    def setUp(self):
+        self._old_cwd = os.getcwd()
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp_dir.name)
+        self.window = MainWindow()
+        self.activity_id = self.window.db_manager.add_activity('Work')
+
+    def tearDown(self):
+        self.window.db_manager.close()
+        self.window.deleteLater()
+        app.processEvents()
+        os.chdir(self._old_cwd)
+        self._tmp_dir.cleanup()
+
+    def _review_dialog(self):
+        intervals = [{'type': 'work', 'duration_seconds': 600}, {'type': 'break', 'duration_seconds': 120}]
+        return PostSessionReviewDialog(self.window.db_manager, self.activity_id, 'Work', 1.0,
+                                       intervals, self.window, parent=self.window)
+
+    def _save(self, dialog):
+        reported = []
+        dialog.session_reviewed_and_saved.connect(lambda *args: reported.append(args[3]))
+        with mock.patch.object(time_tracker_app.QMessageBox, 'warning') as warning:
+            dialog._save_marked_and_accept()
+        return reported, warning
+
+    def test_all_marked_intervals_saved(self):
+        reported, warning = self._save(self._review_dialog())
+        self.assertEqual(reported, [[{'type': 'work', 'duration_seconds': 600},
+                                     {'type': 'break', 'duration_seconds': 120}]])
+        warning.assert_not_called()
+
+    def test_partial_save_reports_only_written_intervals(self):
+        dialog = self._review_dialog()
+        # Only the first row makes it into the DB
+        with mock.patch.object(self.window.db_manager, 'add_time_entries', side_effect=lambda rows: rows[:1]):
+            reported, warning = self._save(dialog)
+        self.assertEqual(reported, [[{'type': 'work', 'duration_seconds': 600}]])
+        warning.assert_called_once()
+        self.assertIn("'break' interval of 120s", warning.call_args.args[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
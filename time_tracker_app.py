@@ -1,29 +1,86 @@
 import sys
-from functools import partial
+from functools import partial, lru_cache
 import uuid
 import sqlite3
 import time
 import os
 import math
-from collections import defaultdict, deque
+import calendar
+import logging
+from collections import OrderedDict
+from bisect import bisect_right
+from array import array
 # Import all necessary PyQt6 classes
 from PyQt6.QtWidgets import (
     QMenu, QStyle, QSizePolicy, QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QTreeWidgetItemIterator, QGroupBox, QLineEdit, QLabel, QMessageBox, QListWidgetItem,
+    QPushButton, QGroupBox, QLineEdit, QLabel, QMessageBox, QListWidgetItem,
     QDialog, QDialogButtonBox, QInputDialog, QDateTimeEdit, QSpinBox, QCheckBox, QRadioButton,
-    QDateEdit, QTableWidget, QTableWidgetItem, QHeaderView, QSplitter, QTableView,
+    QDateEdit, QTableWidget, QTableWidgetItem, QHeaderView, QSplitter, QTableView, QTreeView,
     QTreeWidget, QTreeWidgetItem, QMenu, QAbstractItemView, QStyledItemDelegate, QStyleOptionViewItem,
     QDoubleSpinBox, QFormLayout
 )
-from PyQt6.QtCore import (Qt, QRect, QSize, QPointF, QTimer, QAbstractTableModel, QModelIndex, QDate, QVariant,
+from PyQt6.QtCore import (Qt, QRect, QSize, QPointF, QTimer, QAbstractTableModel, QAbstractItemModel, QModelIndex, QDate, QVariant,
 pyqtSignal, QTimer, QRectF, QEvent, QPoint, QDateTime, QLocale
 )
-from PyQt6.QtGui import QPainter, QPainterPath, QFontMetrics, QColor, QBrush, QPen, QFont, QPalette, QLinearGradient, QAction , QIcon
+from PyQt6.QtGui import QPainter, QPainterPath, QFontMetrics, QColor, QBrush, QPen, QFont, QPalette, QLinearGradient, QGradient, QAction , QIcon, QStaticText, QTransform, QPixmap
+log = logging.getLogger(__name__) # DatabaseManager and HabitTableModel messages; success/trace lines are DEBUG (off by default)
+
 # --- Constants ---
 DATABASE_NAME = 'time_tracker.db'
+# PRAGMA user_version written after a complete _create_tables run; bump it whenever the schema,
+# indexes, triggers or migrations in _create_tables change so existing databases run them once
+SQLITE_SCHEMA_VERSION = 2
+# Applied on every connection: WAL + NORMAL sync makes each commit an append instead of a full fsync
+# (still crash-safe, a power loss can only drop the last commits); the rest keeps more of the DB in memory
+SQLITE_CONNECTION_PRAGMAS = (
+    "PRAGMA page_size = 4096", # only takes effect on a new, empty DB, so it must precede the switch to WAL
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456", # 256 MB
+    "PRAGMA cache_size = -20000", # ~20 MB page cache
+)
+SQLITE_CACHED_STATEMENTS = 256 # sqlite3 per-connection prepared statement cache (default 128)
+SQLITE_FETCH_ARRAYSIZE = 1000 # rows per fetchmany() chunk for the large habit-log scans
+
+# SQL of the hot single-row paths, kept as constants so every call passes the exact same text
+# and hits the connection's prepared statement cache (it is keyed by SQL text)
+_SQL_INSERT_TIME_ENTRY = """
+    INSERT INTO time_entries (activity_id, duration_seconds, entry_type, session_id, timestamp)
+    VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+"""
+_SQL_UPSERT_HABIT_LOG = "INSERT OR REPLACE INTO habit_logs (activity_id, log_date, value) VALUES (?, ?, ?)"
+_SQL_DELETE_HABIT_LOG = "DELETE FROM habit_logs WHERE activity_id = ? AND log_date = ?"
+_SQL_HABIT_LOG_VALUE = "SELECT value FROM habit_logs WHERE activity_id = ? AND log_date = ?"
+_SQL_AVERAGE_DURATION = "SELECT AVG(duration_seconds) FROM time_entries WHERE activity_id = ?"
+_SQL_DELETE_ACTIVITY = "DELETE FROM activities WHERE id = ?"
+# Activity + all descendants, deepest first. Depth is capped by the row count, so a parent cycle still terminates
+_SQL_ACTIVITY_BRANCH_DEEPEST_FIRST = """
+    WITH RECURSIVE branch(id, depth) AS (
+        SELECT :aid, 0
+        UNION
+        SELECT a.id, b.depth + 1 FROM activities a JOIN branch b ON a.parent_id = b.id
+        WHERE b.depth < (SELECT COUNT(*) FROM activities)
+    )
+    SELECT id FROM branch GROUP BY id ORDER BY MAX(depth) DESC
+"""
+# One month of habit logs; the day of month is cut out of 'YYYY-MM-DD' by SQLite, so no date string reaches Python
+_SQL_HABIT_LOG_DAYS_MONTH = ("SELECT activity_id, CAST(substr(log_date, 9, 2) AS INTEGER), value FROM habit_logs "
+                             "WHERE log_date >= ? AND log_date < ?")
+_SQL_UPDATE_HABIT_ORDER = "UPDATE activities SET habit_sort_order = ? WHERE id = ?"
+# update_habit_order binds 2 variables per (id, position) pair; 450 pairs stay under the old 999-variable limit
+HABIT_ORDER_UPDATE_CHUNK = 450
+CELL_STAMP_MARGIN = 1 # Heatmap cell stamp pixmaps extend this many px around the cell for the antialiased outline
 COUNTDOWN_SAVE_THRESHOLD = 0.10  # 10% OVERRUN to suggest saving
 COUNTDOWN_MIN_ENTRIES_FOR_SAVE = 1 # Minimum number of entries to suggest saving
 MAX_OVERRUN_SECONDS_FOR_RED = 60 # Seconds of overrun for maximum redness (60 seconds)
+SNAPSHOT_CACHE_MAX_DAYS = 32 # Days kept in the Daily Snapshot dialog's cache
+SNAPSHOT_TODAY_CACHE_BUCKET_SECONDS = 300 # Today's cached snapshot is reused within a 5-minute bucket
+SELECTION_UI_DEBOUNCE_MS = 80 # Selection-driven status/button refresh waits for the selection to settle
+SUMMARY_TREE_FULL_EXPAND_LIMIT = 200 # Above this many rows the snapshot tree expands only to depth 1
+_PAD2 = tuple(f"{i:02d}" for i in range(100)) # Zero-padded "00".."99" for format_time
+NS_PER_SECOND = 1_000_000_000 # Timer intervals are measured with time.monotonic_ns()
+_MMSS = tuple(_PAD2[t // 60] + ":" + _PAD2[t % 60] for t in range(3600)) # "MM:SS" for 0..3599 seconds
 
 # Habit Types Enum (using constants for clarity)
 HABIT_TYPE_NONE = 0
@@ -31,6 +88,20 @@ HABIT_TYPE_BINARY = 1
 HABIT_TYPE_PERCENTAGE = 2
 HABIT_TYPE_NUMERIC = 3
 
+# How many habits were "done" per day, aggregated by SQLite (heatmap and global streaks):
+# binary == 1, percentage >= 100, numeric >= a positive goal
+_SQL_DAILY_DONE_COUNTS = f"""
+    SELECT l.log_date, COUNT(*) FROM habit_logs l JOIN activities a ON a.id = l.activity_id
+    WHERE l.log_date BETWEEN ? AND ?
+      AND CASE a.habit_type
+            WHEN {HABIT_TYPE_BINARY} THEN l.value = 1.0
+            WHEN {HABIT_TYPE_PERCENTAGE} THEN l.value >= 100.0
+            WHEN {HABIT_TYPE_NUMERIC} THEN a.habit_goal > 0 AND l.value >= a.habit_goal
+            ELSE 0
+          END
+    GROUP BY l.log_date ORDER BY l.log_date
+"""
+
 # Custom Data Roles for Habit Grid Items
 HABIT_VALUE_ROLE = Qt.ItemDataRole.UserRole + 0
 HABIT_TYPE_ROLE = Qt.ItemDataRole.UserRole + 1
@@ -45,17 +116,33 @@ class DatabaseManager:
         self.db_name = db_name
         self.conn = None
         self.cursor = None
+        # Счетчики версий для кэшей: activity_version растет при любом изменении таблицы
+        # activities (add/rename/delete/habit config), entries_version - при изменении time_entries
+        self.activity_version = 0
+        self.entries_version = 0
+        self._hierarchy_cache = None # (version, hierarchy)
+        self._avg_duration_cache = {} # {activity_id: avg entry duration}, valid for _avg_duration_cache_version
+        self._avg_duration_cache_version = None # (activity_version, entries_version)
+        self._descendant_count_cache = {} # {activity_id: descendant count}, valid for _descendant_count_cache_version
+        self._descendant_count_cache_version = None
+        self._activity_names_unique = False # True once idx_activities_name_parent enforces unique names per parent
         self._connect()
         self._create_tables()
 
     def _connect(self):
         try:
-            self.conn = sqlite3.connect(self.db_name, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+            # detect_types=0: no column uses a registered converter (log_date is TEXT, timestamp DATETIME,
+            # no "[type]" column aliases), so skip the per-column decltype/colname lookup on every row
+            self.conn = sqlite3.connect(self.db_name, detect_types=0,
+                                        cached_statements=SQLITE_CACHED_STATEMENTS)
             self.conn.execute("PRAGMA foreign_keys = ON;")
+            for pragma in SQLITE_CONNECTION_PRAGMAS:
+                self.conn.execute(pragma)
             self.cursor = self.conn.cursor()
-            print("Database connected.")
+            self.cursor.arraysize = SQLITE_FETCH_ARRAYSIZE
+            log.info("Database connected.")
         except sqlite3.Error as e:
-            print(f"Database connection error: {e}")
+            log.error("Database connection error: %s", e)
             self.conn = None
             self.cursor = None
 
@@ -89,8 +176,7 @@ class DatabaseManager:
         FROM SessionDurations;
         """
         try:
-            self.cursor.execute(query, (activity_id,))
-            result = self.cursor.fetchone()
+            result = self.conn.execute(query, (activity_id,)).fetchone()
             # AVG вернет None, если в SessionDurations не было строк, или если все значения были NULL
             if result and result[0] is not None: # Проверяем, что AVG вернул не NULL (хотя бы одна сессия была)
                 # Заменяем возможный None (если были только 'break' или только 'work' сессии) на 0
@@ -102,45 +188,54 @@ class DatabaseManager:
                 # Не найдено сессий с session_id или все сессии были нулевой длины
                 return (0, 0, 0)
         except sqlite3.Error as e:
-            print(f"Error calculating average session times for activity {activity_id}: {e}")
+            log.error("Error calculating average session times for activity %s: %s", activity_id, e)
             return (0, 0, 0)
 
-    def _add_column_if_not_exists(self, table_name, column_name, column_def):
-        """Helper to add a column if it doesn't exist."""
+    def _get_table_columns(self, table_name):
+        """Column names of a table (one PRAGMA table_info)."""
+        self.cursor.execute(f"PRAGMA table_info({table_name})")
+        return {info[1] for info in self.cursor}
+
+    def _add_column_if_not_exists(self, table_name, column_name, column_def, existing_columns=None):
+        """Helper to add a column if it doesn't exist.
+        existing_columns: optional set from _get_table_columns, reused across calls for the same
+        table (and updated here) so a migration with several columns reads the schema only once."""
         if not self.conn: return
         try:
-            self.cursor.execute(f"PRAGMA table_info({table_name})")
-            columns = [info[1] for info in self.cursor.fetchall()]
+            columns = existing_columns if existing_columns is not None else self._get_table_columns(table_name)
             if column_name not in columns:
-                print(f"Adding column '{column_name}' to table '{table_name}'...")
+                log.info("Adding column '%s' to table '%s'...", column_name, table_name)
                 self.cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_def}")
                 self.conn.commit()
-                print(f"Column '{column_name}' added.")
+                columns.add(column_name)
+                log.info("Column '%s' added.", column_name)
         except sqlite3.Error as e:
-            print(f"Error checking/adding column {column_name} to {table_name}: {e}")
+            log.error("Error checking/adding column %s to %s: %s", column_name, table_name, e)
             self.conn.rollback()
 
-    def get_habit_logs_for_date_range(self, start_date_str, end_date_str):
-        """Gets all habit logs within a date range."""
-        if not self.conn: return {}
-        logs = {} # Format: {(activity_id, date_str): value}
+    def get_daily_done_counts(self, start_date_str, end_date_str):
+        """Gets the number of habits 'done' per day within a date range (inclusive).
+
+        Returns [(date_str, done_count), ...] only for days with at least one done habit; the
+        per-type done rule is evaluated by SQLite, so no individual log reaches Python.
+        """
+        if not self.conn: return []
         try:
-            # Fetch logs between the start and end dates (inclusive)
-            self.cursor.execute(
-                "SELECT activity_id, log_date, value FROM habit_logs WHERE log_date BETWEEN ? AND ?",
-                (start_date_str, end_date_str)
-            )
-            for row in self.cursor.fetchall():
-                logs[(row[0], row[1])] = row[2]
-            print(f"DB Manager: Fetched {len(logs)} logs between {start_date_str} and {end_date_str}")
-            return logs
+            return self.conn.execute(_SQL_DAILY_DONE_COUNTS, (start_date_str, end_date_str)).fetchall()
         except sqlite3.Error as e:
-            print(f"Error retrieving habit logs for range {start_date_str} - {end_date_str}: {e}")
-            return {}
+            log.error("Error retrieving daily done counts for range %s - %s: %s", start_date_str, end_date_str, e)
+            return []
 
     def _create_tables(self):
         if not self.conn: return
         try:
+            # Схема уже актуальна: пропускаем CREATE/ALTER/индексы и миграции при каждом запуске
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] >= SQLITE_SCHEMA_VERSION:
+                # user_version записывается только вместе с уникальным индексом имен (см. ниже)
+                self._activity_names_unique = True
+                log.info("Schema is up to date (user_version %s).", SQLITE_SCHEMA_VERSION)
+                return
+
             # Activities table (без изменений)
             self.cursor.execute('''
                 CREATE TABLE IF NOT EXISTS activities (
@@ -154,10 +249,11 @@ class DatabaseManager:
                     FOREIGN KEY (parent_id) REFERENCES activities (id) ON DELETE SET NULL
                 )
             ''')
-            self._add_column_if_not_exists('activities', 'habit_type', 'INTEGER DEFAULT NULL')
-            self._add_column_if_not_exists('activities', 'habit_unit', 'TEXT DEFAULT NULL')
-            self._add_column_if_not_exists('activities', 'habit_sort_order', 'INTEGER')
-            self._add_column_if_not_exists('activities', 'habit_goal', 'REAL DEFAULT NULL')
+            activity_columns = self._get_table_columns('activities')
+            self._add_column_if_not_exists('activities', 'habit_type', 'INTEGER DEFAULT NULL', activity_columns)
+            self._add_column_if_not_exists('activities', 'habit_unit', 'TEXT DEFAULT NULL', activity_columns)
+            self._add_column_if_not_exists('activities', 'habit_sort_order', 'INTEGER', activity_columns)
+            self._add_column_if_not_exists('activities', 'habit_goal', 'REAL DEFAULT NULL', activity_columns)
 
             # Time Entries Table - <<< ИЗМЕНЕНИЯ ЗДЕСЬ >>>
             self.cursor.execute('''
@@ -172,8 +268,9 @@ class DatabaseManager:
                 )
             ''')
             # Добавляем новые колонки, если их нет
-            self._add_column_if_not_exists('time_entries', 'entry_type', "TEXT DEFAULT 'work' NOT NULL CHECK(entry_type IN ('work', 'break'))")
-            self._add_column_if_not_exists('time_entries', 'session_id', 'REAL')
+            entry_columns = self._get_table_columns('time_entries')
+            self._add_column_if_not_exists('time_entries', 'entry_type', "TEXT DEFAULT 'work' NOT NULL CHECK(entry_type IN ('work', 'break'))", entry_columns)
+            self._add_column_if_not_exists('time_entries', 'session_id', 'REAL', entry_columns)
             # <<< КОНЕЦ ИЗМЕНЕНИЙ >>>
 
             # Habit Logs Table (без изменений)
@@ -188,21 +285,111 @@ class DatabaseManager:
                 )
             ''')
 
+            # Daily totals summary table: work/break seconds per (UTC date, activity),
+            # kept in sync with time_entries by triggers, so the daily snapshot reads
+            # a handful of rows instead of summing every entry of the day.
+            daily_totals_existed = self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_activity_totals'").fetchone() is not None
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS daily_activity_totals (
+                    date TEXT NOT NULL,
+                    activity_id INTEGER NOT NULL,
+                    work_seconds INTEGER NOT NULL DEFAULT 0,
+                    break_seconds INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (date, activity_id),
+                    FOREIGN KEY (activity_id) REFERENCES activities (id) ON DELETE CASCADE
+                ) WITHOUT ROWID
+            ''')
+            self.cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_time_entries_totals_insert AFTER INSERT ON time_entries
+                BEGIN
+                    INSERT INTO daily_activity_totals (date, activity_id, work_seconds, break_seconds)
+                    VALUES (DATE(NEW.timestamp), NEW.activity_id,
+                            CASE WHEN NEW.entry_type = 'work' THEN NEW.duration_seconds ELSE 0 END,
+                            CASE WHEN NEW.entry_type = 'break' THEN NEW.duration_seconds ELSE 0 END)
+                    ON CONFLICT(date, activity_id) DO UPDATE SET
+                        work_seconds = work_seconds + excluded.work_seconds,
+                        break_seconds = break_seconds + excluded.break_seconds;
+                END
+            ''')
+            self.cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_time_entries_totals_delete AFTER DELETE ON time_entries
+                BEGIN
+                    UPDATE daily_activity_totals SET
+                        work_seconds = work_seconds - CASE WHEN OLD.entry_type = 'work' THEN OLD.duration_seconds ELSE 0 END,
+                        break_seconds = break_seconds - CASE WHEN OLD.entry_type = 'break' THEN OLD.duration_seconds ELSE 0 END
+                    WHERE date = DATE(OLD.timestamp) AND activity_id = OLD.activity_id;
+                    DELETE FROM daily_activity_totals
+                    WHERE date = DATE(OLD.timestamp) AND activity_id = OLD.activity_id
+                      AND work_seconds = 0 AND break_seconds = 0;
+                END
+            ''')
+            self.cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_time_entries_totals_update
+                AFTER UPDATE OF activity_id, duration_seconds, timestamp, entry_type ON time_entries
+                BEGIN
+                    UPDATE daily_activity_totals SET
+                        work_seconds = work_seconds - CASE WHEN OLD.entry_type = 'work' THEN OLD.duration_seconds ELSE 0 END,
+                        break_seconds = break_seconds - CASE WHEN OLD.entry_type = 'break' THEN OLD.duration_seconds ELSE 0 END
+                    WHERE date = DATE(OLD.timestamp) AND activity_id = OLD.activity_id;
+                    DELETE FROM daily_activity_totals
+                    WHERE date = DATE(OLD.timestamp) AND activity_id = OLD.activity_id
+                      AND work_seconds = 0 AND break_seconds = 0;
+                    INSERT INTO daily_activity_totals (date, activity_id, work_seconds, break_seconds)
+                    VALUES (DATE(NEW.timestamp), NEW.activity_id,
+                            CASE WHEN NEW.entry_type = 'work' THEN NEW.duration_seconds ELSE 0 END,
+                            CASE WHEN NEW.entry_type = 'break' THEN NEW.duration_seconds ELSE 0 END)
+                    ON CONFLICT(date, activity_id) DO UPDATE SET
+                        work_seconds = work_seconds + excluded.work_seconds,
+                        break_seconds = break_seconds + excluded.break_seconds;
+                END
+            ''')
+            if not daily_totals_existed:
+                # Первый запуск с таблицей итогов: заполняем ее из уже существующих записей
+                self.cursor.execute('''
+                    INSERT INTO daily_activity_totals (date, activity_id, work_seconds, break_seconds)
+                    SELECT DATE(timestamp), activity_id,
+                           SUM(CASE WHEN entry_type = 'work' THEN duration_seconds ELSE 0 END),
+                           SUM(CASE WHEN entry_type = 'break' THEN duration_seconds ELSE 0 END)
+                    FROM time_entries
+                    GROUP BY DATE(timestamp), activity_id
+                ''')
+                log.info("daily_activity_totals backfilled (%s rows).", self.cursor.rowcount)
+
             # Indexes (Добавлен индекс для session_id)
             self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_activity_parent_id ON activities (parent_id);')
-            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_activity_habit_type ON activities (habit_type);')
-            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_activity_habit_sort_order ON activities (habit_sort_order);')
+            # Partial index matching get_all_habits (WHERE habit_type IS NOT NULL ORDER BY habit_sort_order, name):
+            # non-habit activities never touch it. Replaces the low-selectivity habit_type / habit_sort_order indexes.
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_activities_habit ON activities (habit_sort_order, name) WHERE habit_type IS NOT NULL;')
+            self.cursor.execute('DROP INDEX IF EXISTS idx_activity_habit_type;')
+            self.cursor.execute('DROP INDEX IF EXISTS idx_activity_habit_sort_order;')
             self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_activity_id_timestamp ON time_entries (activity_id, timestamp);')
             self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_timestamp_date ON time_entries (timestamp);')
-            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_habit_logs_date_activity ON habit_logs (log_date, activity_id);')
+            # Covering index: date-range/month reads (activity_id, log_date, value) are answered from the
+            # index alone. It has the same leading columns as idx_habit_logs_date_activity, which it replaces.
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_habit_logs_covering ON habit_logs (log_date, activity_id, value);')
+            self.cursor.execute('DROP INDEX IF EXISTS idx_habit_logs_date_activity;')
             self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_time_entries_session_id ON time_entries (session_id);') # Новый индекс
 
+            # Одноразово приводим старые timestamp к 'yyyy-MM-dd HH:mm:ss', чтобы чтение отдавало текст как есть,
+            # без strftime() на каждую строку (DATE() не меняется, триггер итогов отрабатывает корректно)
+            self.cursor.execute("""
+                UPDATE time_entries SET timestamp = strftime('%Y-%m-%d %H:%M:%S', timestamp)
+                WHERE timestamp IS NOT strftime('%Y-%m-%d %H:%M:%S', timestamp)
+                  AND strftime('%Y-%m-%d %H:%M:%S', timestamp) IS NOT NULL
+            """)
+            if self.cursor.rowcount > 0:
+                log.info("Normalized %s time entry timestamps.", self.cursor.rowcount)
+
             self.conn.commit()
-            print("Tables checked/created/updated (with entry_type, session_id).")
+            log.info("Tables checked/created/updated (with entry_type, session_id).")
+            self._create_activity_name_index()
             self._initialize_habit_order()
+            # Пока в БД есть дубликаты имен (нет уникального индекса), полная проверка повторяется при запуске
+            if self._activity_names_unique:
+                self.conn.execute(f"PRAGMA user_version = {SQLITE_SCHEMA_VERSION}")
 
         except sqlite3.Error as e:
-            print(f"Error creating/updating tables: {e}")
+            log.error("Error creating/updating tables: %s", e)
             if self.conn: self.conn.rollback()
 
     def _initialize_habit_order(self):
@@ -210,8 +397,7 @@ class DatabaseManager:
         if not self.conn: return
         try:
             # Find max existing order, or start from 0
-            self.cursor.execute("SELECT MAX(habit_sort_order) FROM activities WHERE habit_sort_order IS NOT NULL")
-            max_order_result = self.cursor.fetchone()
+            max_order_result = self.conn.execute("SELECT MAX(habit_sort_order) FROM activities WHERE habit_sort_order IS NOT NULL").fetchone()
             max_order = max_order_result[0] if max_order_result else None
             next_order = 0 if max_order is None else max_order + 1
 
@@ -220,17 +406,30 @@ class DatabaseManager:
             habits_to_order = self.cursor.fetchall()
 
             if habits_to_order:
-                 print(f"Initializing sort order for {len(habits_to_order)} habits...")
-                 for habit_id_tuple in habits_to_order:
-                     habit_id = habit_id_tuple[0]
-                     self.cursor.execute("UPDATE activities SET habit_sort_order = ? WHERE id = ?", (next_order, habit_id))
-                     print(f"  Set order {next_order} for activity ID {habit_id}")
-                     next_order += 1
+                 log.info("Initializing sort order for %s habits...", len(habits_to_order))
+                 # Один подготовленный UPDATE на все строки и один commit
+                 params = [(next_order + i, habit_id) for i, (habit_id,) in enumerate(habits_to_order)]
+                 self.cursor.executemany(_SQL_UPDATE_HABIT_ORDER, params)
                  self.conn.commit()
-                 print("Habit order initialization complete.")
+                 log.info("Habit order initialization complete (orders %s..%s).", next_order, next_order + len(params) - 1)
 
         except sqlite3.Error as e:
-            print(f"Error initializing habit sort order: {e}")
+            log.error("Error initializing habit sort order: %s", e)
+            self.conn.rollback()
+
+    def _create_activity_name_index(self):
+        """Lets SQLite enforce unique activity names per parent (IFNULL maps top-level to one group),
+        so add/rename need no separate duplicate SELECT. An old DB that already has duplicates
+        keeps working without the index, using _check_activity_name_exists instead."""
+        try:
+            self.cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_activities_name_parent ON activities (name, IFNULL(parent_id, -1));')
+            self.conn.commit()
+            self._activity_names_unique = True
+        except sqlite3.IntegrityError as e:
+            log.warning("Duplicate activity names under one parent exist (%s); checking names before each add/rename instead.", e)
+            self.conn.rollback()
+        except sqlite3.Error as e:
+            log.error("Error creating activity name index: %s", e)
             self.conn.rollback()
 
     def _check_activity_name_exists(self, name, parent_id):
@@ -238,27 +437,27 @@ class DatabaseManager:
         if not self.conn: return True
         try:
             if parent_id is None:
-                self.cursor.execute("SELECT 1 FROM activities WHERE name = ? AND parent_id IS NULL", (name,))
+                row = self.conn.execute("SELECT 1 FROM activities WHERE name = ? AND parent_id IS NULL", (name,)).fetchone()
             else:
-                self.cursor.execute("SELECT 1 FROM activities WHERE name = ? AND parent_id = ?", (name, parent_id))
-            return self.cursor.fetchone() is not None
+                row = self.conn.execute("SELECT 1 FROM activities WHERE name = ? AND parent_id = ?", (name, parent_id)).fetchone()
+            return row is not None
         except sqlite3.Error as e:
-            print(f"Error checking activity name: {e}")
+            log.error("Error checking activity name: %s", e)
             return True
 
     def add_activity(self, name, parent_id=None):
         """Adds an activity, optionally specifying a parent."""
         if not self.conn or not name:
-            print("DB_ADD_ACTIVITY_ERROR: No connection or name provided.")
+            log.error("DB_ADD_ACTIVITY_ERROR: No connection or name provided.")
             return None
         name_stripped = name.strip() # Ensure name is stripped before checks and insert
         if not name_stripped:
-            print("DB_ADD_ACTIVITY_ERROR: Name is empty after stripping.")
+            log.error("DB_ADD_ACTIVITY_ERROR: Name is empty after stripping.")
             return None
 
-        # Check for duplicate name under the same parent first
-        if self._check_activity_name_exists(name_stripped, parent_id):
-            print(f"DB_ADD_ACTIVITY_WARN: Activity '{name_stripped}' already exists with the same parent (parent_id: {parent_id}).")
+        # Without the unique index, check for a duplicate name under the same parent first
+        if not self._activity_names_unique and self._check_activity_name_exists(name_stripped, parent_id):
+            log.warning("DB_ADD_ACTIVITY_WARN: Activity '%s' already exists with the same parent (parent_id: %s).", name_stripped, parent_id)
             # QMessageBox is a UI element, ideally not called directly from DB Manager.
             # This warning should be handled by the caller (MainWindow) if desired.
             # For now, we just print and return None.
@@ -266,49 +465,54 @@ class DatabaseManager:
             return None
 
         try:
-            # --- EXTENDED DEBUGGING ---
-            debug_msg_parts = [
-                f"DB_ADD_ACTIVITY_ATTEMPT: Inserting '{name_stripped}'",
-                f"with parent_id: {parent_id}",
-                f"(type: {type(parent_id)})."
-            ]
-
-            if parent_id is not None:
-                # Explicitly check if the parent_id exists in the activities table
-                self.cursor.execute("SELECT 1 FROM activities WHERE id = ?", (parent_id,))
-                parent_exists_in_db = self.cursor.fetchone()
-                if parent_exists_in_db:
-                    debug_msg_parts.append("Parent ID check: EXISTS in DB.")
+            # --- EXTENDED DEBUGGING (only when DEBUG logging is on: it costs an extra SELECT) ---
+            if log.isEnabledFor(logging.DEBUG):
+                debug_msg_parts = [
+                    f"DB_ADD_ACTIVITY_ATTEMPT: Inserting '{name_stripped}'",
+                    f"with parent_id: {parent_id}",
+                    f"(type: {type(parent_id)})."
+                ]
+
+                if parent_id is not None:
+                    # Explicitly check if the parent_id exists in the activities table
+                    parent_exists_in_db = self.conn.execute("SELECT 1 FROM activities WHERE id = ?", (parent_id,)).fetchone()
+                    if parent_exists_in_db:
+                        debug_msg_parts.append("Parent ID check: EXISTS in DB.")
+                    else:
+                        # This is the most likely cause of FOREIGN KEY constraint failed
+                        debug_msg_parts.append("Parent ID check: DOES NOT EXIST in DB! <<< LIKELY CAUSE OF ERROR")
                 else:
-                    # This is the most likely cause of FOREIGN KEY constraint failed
-                    debug_msg_parts.append("Parent ID check: DOES NOT EXIST in DB! <<< LIKELY CAUSE OF ERROR")
-            else:
-                debug_msg_parts.append("Parent ID is None (top-level activity).")
+                    debug_msg_parts.append("Parent ID is None (top-level activity).")
             
-            print(" ".join(debug_msg_parts))
+                log.debug("%s", " ".join(debug_msg_parts))
             # --- END EXTENDED DEBUGGING ---
 
-            self.cursor.execute("INSERT INTO activities (name, parent_id) VALUES (?, ?)", (name_stripped, parent_id))
+            # With idx_activities_name_parent a duplicate name is skipped by SQLite (rowcount 0)
+            self.cursor.execute("INSERT OR IGNORE INTO activities (name, parent_id) VALUES (?, ?)", (name_stripped, parent_id))
+            if self.cursor.rowcount == 0:
+                self.conn.rollback()
+                log.warning("DB_ADD_ACTIVITY_WARN: Activity '%s' already exists with the same parent (parent_id: %s).", name_stripped, parent_id)
+                return None
             self.conn.commit()
+            self.activity_version += 1
             new_id = self.cursor.lastrowid
-            print(f"DB_ADD_ACTIVITY_SUCCESS: Activity '{name_stripped}' (ID: {new_id}, parent_id: {parent_id}) added.")
+            log.debug("DB_ADD_ACTIVITY_SUCCESS: Activity '%s' (ID: %s, parent_id: %s) added.", name_stripped, new_id, parent_id)
             return new_id
         except sqlite3.Error as e:
             error_message = f"DB_ADD_ACTIVITY_ERROR: Error adding activity '{name_stripped}' with parent_id {parent_id}: {e}"
-            print(error_message)
+            log.error("%s", error_message)
             # If it's a foreign key error, let's get more info about existing IDs for context
             if "FOREIGN KEY constraint failed" in str(e):
                 try:
                     self.cursor.execute("SELECT id FROM activities ORDER BY id DESC LIMIT 10")
                     recent_ids = self.cursor.fetchall()
-                    print(f"DB_ADD_ACTIVITY_DEBUG: Recent activity IDs in DB: {recent_ids}")
+                    log.debug("DB_ADD_ACTIVITY_DEBUG: Recent activity IDs in DB: %s", recent_ids)
                     if parent_id is not None:
-                         self.cursor.execute("SELECT * FROM activities WHERE id = ?", (parent_id,))
-                         parent_row_details = self.cursor.fetchone()
-                         print(f"DB_ADD_ACTIVITY_DEBUG: Details for attempted parent_id {parent_id} in DB: {parent_row_details}")
+                         parent_row_details = self.conn.execute("SELECT * FROM activities WHERE id = ?", (parent_id,)).fetchone()
+                         log.debug("DB_ADD_ACTIVITY_DEBUG: Details for attempted parent_id %s in DB: %s", parent_id, parent_row_details)
 
                 except Exception as query_e:
-                    print(f"DB_ADD_ACTIVITY_DEBUG: Could not fetch debug info on error: {query_e}")
+                    log.error("DB_ADD_ACTIVITY_DEBUG: Could not fetch debug info on error: %s", query_e)
             self.conn.rollback() # Ensure rollback on any error
             return None
     
@@ -319,15 +523,19 @@ class DatabaseManager:
             self.cursor.execute("SELECT id, name, parent_id FROM activities ORDER BY name")
             return self.cursor.fetchall()
         except sqlite3.Error as e:
-            print(f"Error retrieving activities: {e}")
+            log.error("Error retrieving activities: %s", e)
             return []
 
     def get_activity_hierarchy(self):
-        """Builds the activity hierarchy, including habit info."""
+        """Builds the activity hierarchy, including habit info.
+        The result is cached until the activities table changes; callers must not mutate it."""
         if not self.conn: return {}
+        if self._hierarchy_cache is not None and self._hierarchy_cache[0] == self.activity_version:
+            return self._hierarchy_cache[1]
         try:
-            # Fetch all relevant columns
-            self.cursor.execute("SELECT id, name, parent_id, habit_type, habit_unit FROM activities")
+            # Fetch all relevant columns, already ordered by name (BINARY collation = Python str order):
+            # appending in this order leaves every children list sorted, no per-level sort needed
+            self.cursor.execute("SELECT id, name, parent_id, habit_type, habit_unit FROM activities ORDER BY name, id")
             activities_raw = self.cursor.fetchall()
             activities_dict = {
                 act_id: {
@@ -341,81 +549,107 @@ class DatabaseManager:
                 if parent_id is None: top_level.append(data)
                 elif parent_id in activities_dict: activities_dict[parent_id]['children'].append(data)
                 else:
-                    print(f"Warning: Parent ID {parent_id} for activity ID {act_id} not found.")
+                    log.warning("Warning: Parent ID %s for activity ID %s not found.", parent_id, act_id)
                     top_level.append(data)
-
-            def sort_children_recursive(nodes):
-                nodes.sort(key=lambda x: x['name'])
-                for node in nodes:
-                    if node['children']: sort_children_recursive(node['children'])
-            sort_children_recursive(top_level)
+            self._hierarchy_cache = (self.activity_version, top_level)
             return top_level
         except sqlite3.Error as e:
-            print(f"Error retrieving activity hierarchy: {e}")
+            log.error("Error retrieving activity hierarchy: %s", e)
             return []
 
-    def get_descendant_activity_ids(self, activity_id):
-        """Returns a set of IDs of all descendant activities."""
-        if not self.conn or activity_id is None: return set()
-        descendants = set()
-        queue = deque([activity_id])
-        while queue:
-            current_id = queue.popleft()
-            if current_id is None or current_id in descendants: continue
-            descendants.add(current_id)
-            try:
-                self.cursor.execute("SELECT id FROM activities WHERE parent_id = ?", (current_id,))
-                for child_id_tuple in self.cursor.fetchall():
-                    if child_id_tuple[0] not in descendants: queue.append(child_id_tuple[0])
-            except sqlite3.Error as e: print(f"Error finding descendants for ID {current_id}: {e}")
-        return descendants
+    def get_descendant_count(self, activity_id):
+        """Counts descendants (children, grandchildren, ...) of an activity, not the activity itself.
+        Counted in SQL without materializing the IDs; cached until the activities table changes."""
+        if not self.conn or activity_id is None: return 0
+        if self._descendant_count_cache_version != self.activity_version:
+            self._descendant_count_cache.clear()
+            self._descendant_count_cache_version = self.activity_version
+        cached = self._descendant_count_cache.get(activity_id)
+        if cached is not None:
+            return cached
+        try:
+            count = self.conn.execute("""
+                WITH RECURSIVE descendants(id) AS (
+                    SELECT id FROM activities WHERE parent_id = :aid
+                    UNION
+                    SELECT a.id FROM activities a JOIN descendants d ON a.parent_id = d.id
+                )
+                SELECT COUNT(*) FROM descendants WHERE id != :aid
+            """, {'aid': activity_id}).fetchone()[0]
+            self._descendant_count_cache[activity_id] = count
+            return count
+        except sqlite3.Error as e:
+            log.error("Error counting descendants for ID %s: %s", activity_id, e)
+            return 0
 
     def add_time_entry(self, activity_id, duration_seconds, timestamp=None, entry_type='work', session_id=None):
         """
         Добавляет запись времени (работы или перерыва).
         Можно указать timestamp (локальный QDateTime), тип записи и ID сессии.
         """
-        if not self.conn or activity_id is None or duration_seconds < 0:
-            if duration_seconds < 0: print("Warning: Attempted to add negative duration entry.")
-            return False
+        return len(self.add_time_entries([(activity_id, duration_seconds, timestamp, entry_type, session_id)])) == 1
+
+    def _prepare_time_entry_params(self, activity_id, duration_seconds, timestamp=None, entry_type='work', session_id=None):
+        """Validates one entry and returns its INSERT params, or None if the entry must be skipped."""
+        if activity_id is None or duration_seconds < 0:
+            if duration_seconds < 0: log.warning("Warning: Attempted to add negative duration entry.")
+            return None
         duration_seconds = int(duration_seconds)
         if entry_type not in ('work', 'break'):
-            print(f"Warning: Invalid entry_type '{entry_type}'. Defaulting to 'work'.")
+            log.warning("Warning: Invalid entry_type '%s'. Defaulting to 'work'.", entry_type)
             entry_type = 'work'
 
+        ts_str_for_db = None
+        # Обработка timestamp (если передан)
+        if timestamp:
+            if not isinstance(timestamp, QDateTime):
+                try: timestamp = QDateTime.fromString(str(timestamp), "yyyy-MM-dd HH:mm:ss")
+                except Exception: timestamp = None
+            if timestamp and timestamp.isValid():
+                utc_dt = timestamp.toUTC()
+                ts_str_for_db = utc_dt.toString("yyyy-MM-dd HH:mm:ss")
+        # Если ts_str_for_db is None, COALESCE(NULL, CURRENT_TIMESTAMP) вернет CURRENT_TIMESTAMP
+        return (activity_id, duration_seconds, entry_type, session_id, ts_str_for_db)
+
+    def add_time_entries(self, rows):
+        """
+        Добавляет несколько записей времени одной транзакцией (executemany, один commit).
+        rows: итерируемое кортежей (activity_id, duration_seconds, timestamp, entry_type, session_id),
+        поля те же, что у add_time_entry. Возвращает список реально добавленных кортежей из rows
+        (невалидные строки пропускаются, при ошибке БД - пустой список).
+        """
+        if not self.conn: return []
+        accepted_rows, params_list = [], []
+        for row in rows:
+            params = self._prepare_time_entry_params(*row)
+            if params is not None:
+                accepted_rows.append(row)
+                params_list.append(params)
+        return accepted_rows if self._insert_time_entries(params_list) else []
+
+    def _insert_time_entries(self, params_list):
+        """Inserts prepared _SQL_INSERT_TIME_ENTRY params in one transaction. Returns the count inserted (0 on error)."""
+        if not self.conn or not params_list: return 0
         try:
-            ts_str_for_db = None
-            # Обработка timestamp (если передан)
-            if timestamp:
-                if not isinstance(timestamp, QDateTime):
-                    try: timestamp = QDateTime.fromString(str(timestamp), "yyyy-MM-dd HH:mm:ss")
-                    except Exception: timestamp = None
-                if timestamp and timestamp.isValid():
-                    utc_dt = timestamp.toUTC()
-                    ts_str_for_db = utc_dt.toString("yyyy-MM-dd HH:mm:ss")
-
-            # Собираем SQL и параметры
-            # Используем CURRENT_TIMESTAMP базы данных, если timestamp не передан
-            sql = """
-                INSERT INTO time_entries (activity_id, duration_seconds, entry_type, session_id, timestamp)
-                VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
-            """
-            # Если ts_str_for_db есть, он подставится вместо COALESCE(?, ...)
-            # Если ts_str_for_db is None, COALESCE(NULL, CURRENT_TIMESTAMP) вернет CURRENT_TIMESTAMP
-            params = (activity_id, duration_seconds, entry_type, session_id, ts_str_for_db)
-
-            self.cursor.execute(sql, params)
+            # _SQL_INSERT_TIME_ENTRY использует CURRENT_TIMESTAMP базы данных, если timestamp не передан
+            self.cursor.executemany(_SQL_INSERT_TIME_ENTRY, params_list)
             self.conn.commit()
+            self.entries_version += 1
 
-            ts_info = f"с timestamp (UTC) {ts_str_for_db}" if ts_str_for_db else "с текущим timestamp (UTC)"
-            print(f"Запись времени ({entry_type}, {duration_seconds} сек, sess:{session_id}) добавлена для activity_id {activity_id} {ts_info}.")
-            return True
+            if log.isEnabledFor(logging.DEBUG): # ts_info/распаковка нужны только для отладочного сообщения
+                if len(params_list) == 1:
+                    activity_id, duration_seconds, entry_type, session_id, ts_str_for_db = params_list[0]
+                    ts_info = f"с timestamp (UTC) {ts_str_for_db}" if ts_str_for_db else "с текущим timestamp (UTC)"
+                    log.debug("Запись времени (%s, %s сек, sess:%s) добавлена для activity_id %s %s.", entry_type, duration_seconds, session_id, activity_id, ts_info)
+                else:
+                    log.debug("Добавлено записей времени: %s (одной транзакцией).", len(params_list))
+            return len(params_list)
         except sqlite3.Error as e:
-            print(f"Ошибка добавления записи времени ({entry_type}): {e}")
+            log.error("Ошибка добавления записей времени (%s шт.): %s", len(params_list), e)
             if self.conn:
                 try: self.conn.rollback()
-                except sqlite3.Error as rb_err: print(f"Ошибка при откате транзакции: {rb_err}")
-            return False
+                except sqlite3.Error as rb_err: log.error("Ошибка при откате транзакции: %s", rb_err)
+            return 0
 
     def get_entries_for_date_with_type(self, date_str):
         """Gets all time entries for a date, including entry type."""
@@ -424,7 +658,7 @@ class DatabaseManager:
             # Добавляем te.entry_type в SELECT
             self.cursor.execute("""
                 SELECT a.id, a.name, te.duration_seconds, te.entry_type,
-                       strftime('%Y-%m-%d %H:%M:%S', te.timestamp) as timestamp_str,
+                       te.timestamp as timestamp_str, -- хранится уже как 'yyyy-MM-dd HH:mm:ss' (UTC)
                        te.session_id -- Также получаем ID сессии
                 FROM time_entries te JOIN activities a ON te.activity_id = a.id
                 WHERE DATE(te.timestamp) = ?
@@ -433,48 +667,42 @@ class DatabaseManager:
             # Возвращает кортежи (id, name, duration, type, timestamp_str, session_id)
             return self.cursor.fetchall()
         except sqlite3.Error as e:
-            print(f"Error retrieving entries with type for date {date_str}: {e}")
+            log.error("Error retrieving entries with type for date %s: %s", date_str, e)
             return []
 
-    def get_durations(self, activity_id):
-        """Gets durations only for *this* specific activity."""
-        if not self.conn or not activity_id: return []
+    def get_direct_durations_for_date(self, date_str):
+        """Work/break time per activity for a date (direct entries only, no children),
+        read from the trigger-maintained daily_activity_totals table.
+        Returns {activity_id: (work_seconds, break_seconds)}."""
+        if not self.conn or not date_str: return {}
         try:
-            self.cursor.execute("SELECT duration_seconds FROM time_entries WHERE activity_id = ?", (activity_id,))
-            return [row[0] for row in self.cursor.fetchall()]
-        except sqlite3.Error as e:
-            print(f"Error retrieving durations: {e}")
-            return []
-
-    def calculate_total_duration_for_activity_branch(self, activity_id):
-        """Calculates the *total* duration for an activity and all its descendants."""
-        if not self.conn or not activity_id: return 0
-        descendant_ids = self.get_descendant_activity_ids(activity_id)
-        if not descendant_ids: return 0
-        try:
-            placeholders = ', '.join('?' * len(descendant_ids))
-            query = f"SELECT SUM(duration_seconds) FROM time_entries WHERE activity_id IN ({placeholders})"
-            self.cursor.execute(query, list(descendant_ids))
-            result = self.cursor.fetchone()
-            return result[0] if result and result[0] is not None else 0
+            self.cursor.execute("""
+                SELECT activity_id, work_seconds, break_seconds
+                FROM daily_activity_totals
+                WHERE date = ?
+            """, (date_str,))
+            return {activity_id: (work_seconds, break_seconds) for activity_id, work_seconds, break_seconds in self.cursor}
         except sqlite3.Error as e:
-            print(f"Error calculating total duration for branch {activity_id}: {e}")
-            return 0
-
-    def calculate_average_duration(self, activity_id):
-        """Calculates the average duration for *this* specific activity."""
-        durations = self.get_durations(activity_id)
-        return sum(durations) / len(durations) if durations else 0
+            log.error("Error aggregating durations for date %s: %s", date_str, e)
+            return {}
 
-    def get_entry_count(self, activity_id):
-        """Gets the number of time entries for *this* specific activity."""
+    def get_average_entry_duration(self, activity_id):
+        """Average entry duration of *this* activity only (SQL AVG, no row fetch), 0 without entries."""
         if not self.conn or not activity_id: return 0
+        # Повторный выбор той же активности без изменений в БД не делает запросов
+        current_version = (self.activity_version, self.entries_version)
+        if self._avg_duration_cache_version != current_version:
+            self._avg_duration_cache.clear()
+            self._avg_duration_cache_version = current_version
+        cached = self._avg_duration_cache.get(activity_id)
+        if cached is not None:
+            return cached
         try:
-            self.cursor.execute("SELECT COUNT(*) FROM time_entries WHERE activity_id = ?", (activity_id,))
-            result = self.cursor.fetchone()
-            return result[0] if result else 0
+            avg_duration = self.conn.execute(_SQL_AVERAGE_DURATION, (activity_id,)).fetchone()[0] or 0
+            self._avg_duration_cache[activity_id] = avg_duration
+            return avg_duration
         except sqlite3.Error as e:
-            print(f"Error getting entry count: {e}")
+            log.error("Error calculating average duration for activity %s: %s", activity_id, e)
             return 0
 
     def get_time_entries_for_activity(self, activity_id):
@@ -486,7 +714,7 @@ class DatabaseManager:
         try:
             self.cursor.execute(
                 """SELECT id, duration_seconds,
-                          strftime('%Y-%m-%d %H:%M:%S', timestamp) as timestamp_str_utc,
+                          timestamp as timestamp_str_utc,
                           entry_type
                    FROM time_entries
                    WHERE activity_id = ?
@@ -496,7 +724,7 @@ class DatabaseManager:
             # Returns list of tuples: [(id, duration, timestamp_str_utc, entry_type), ...]
             return self.cursor.fetchall()
         except sqlite3.Error as e:
-            print(f"Error retrieving detailed time entries for activity {activity_id}: {e}")
+            log.error("Error retrieving detailed time entries for activity %s: %s", activity_id, e)
             return []
 
     def calculate_average_entry_duration_by_type(self, activity_id, entry_type):
@@ -506,127 +734,65 @@ class DatabaseManager:
         Returns 0 if no such entries or an error occurs.
         """
         if not self.conn or not activity_id or entry_type not in ('work', 'break'):
-            print(f"DB_AVG_TYPE_ERR: Invalid params for avg entry duration by type. ActID: {activity_id}, Type: {entry_type}")
+            log.warning("DB_AVG_TYPE_ERR: Invalid params for avg entry duration by type. ActID: %s, Type: %s", activity_id, entry_type)
             return 0
         try:
-            self.cursor.execute(
+            result = self.conn.execute(
                 "SELECT AVG(duration_seconds) FROM time_entries WHERE activity_id = ? AND entry_type = ?",
                 (activity_id, entry_type)
-            )
-            result = self.cursor.fetchone()
+            ).fetchone()
             # result[0] will be None if no matching rows are found, AVG of NULL is NULL.
             avg_duration = result[0] if result and result[0] is not None else 0
             # print(f"DB_AVG_TYPE_INFO: Avg duration for ActID {activity_id}, Type '{entry_type}': {avg_duration}")
             return float(avg_duration)
         except sqlite3.Error as e:
-            print(f"DB_AVG_TYPE_ERR: Error calculating average duration for activity {activity_id}, type {entry_type}: {e}")
+            log.error("DB_AVG_TYPE_ERR: Error calculating average duration for activity %s, type %s: %s", activity_id, entry_type, e)
             return 0
         except Exception as ex: # Catch any other unexpected errors
-            print(f"DB_AVG_TYPE_UNEXPECTED_ERR: Unexpected error for activity {activity_id}, type {entry_type}: {ex}")
+            log.error("DB_AVG_TYPE_UNEXPECTED_ERR: Unexpected error for activity %s, type %s: %s", activity_id, entry_type, ex)
             return 0
 
-    def _is_habit_done_for_global_streak(self, logged_value, habit_type, habit_goal):
-        """
-        Determines if a habit instance meets its 'done' criteria for global streak calculation.
-        - Binary: Done if 1.0
-        - Percentage: Done if >= 100.0
-        - Numeric with Goal: Done if value >= goal
-        - Numeric without Goal: Cannot be 'done' for this metric as '100%' is undefined.
-        """
-        if logged_value is None:
-            return False
-        
-        if habit_type == HABIT_TYPE_BINARY:
-            return logged_value == 1.0
-        elif habit_type == HABIT_TYPE_PERCENTAGE:
-            return logged_value >= 100.0 # Consistent with HeatmapWidget._is_habit_done
-        elif habit_type == HABIT_TYPE_NUMERIC:
-            if habit_goal is not None and habit_goal > 0:
-                return logged_value >= habit_goal
-            return False # Numeric without a goal doesn't count as "100% done"
-        return False
-
     def calculate_global_daily_streaks(self):
         """
         Calculates current and max global daily streaks based on >75% of all habits being "done".
+        A habit is "done" per _SQL_DAILY_DONE_COUNTS: binary 1.0, percentage >= 100.0, numeric >= a
+        positive goal (numeric without a goal never counts, as '100%' is undefined).
         Returns: (current_streak, max_streak)
         """
         if not self.conn: return (0, 0)
 
         all_configured_habits = self.get_all_habits() # Fetches [(id, name, type, unit, goal), ...]
         if not all_configured_habits:
-            print("StreakCalc: No habits configured.")
+            log.debug("StreakCalc: No habits configured.")
             return (0, 0)
 
         total_configurable_habits = len(all_configured_habits)
-        # Create a dictionary for quick lookup of habit type and goal by id
-        habit_details_map = {h[0]: {"type": h[2], "goal": h[4]} for h in all_configured_habits}
-
-        # Fetch all logs and group them by date
-        logs_by_date = defaultdict(dict) # {'YYYY-MM-DD': {activity_id: value}}
-        earliest_log_date_str = None
-        try:
-            self.cursor.execute("SELECT log_date, activity_id, value FROM habit_logs ORDER BY log_date ASC")
-            all_db_logs = self.cursor.fetchall()
-            if not all_db_logs:
-                print("StreakCalc: No habit logs found in the database.")
-                return (0, 0)
-            
-            earliest_log_date_str = all_db_logs[0][0]
-            for log_date_str, activity_id, value in all_db_logs:
-                logs_by_date[log_date_str][activity_id] = value
-        except sqlite3.Error as e:
-            print(f"StreakCalc Error: Fetching logs failed: {e}")
-            return (0, 0)
-
-        current_s = 0
-        max_s = 0
-        running_s = 0
-        
-        try:
-            loop_q_date = QDate.fromString(earliest_log_date_str, "yyyy-MM-dd")
-            if not loop_q_date.isValid():
-                print(f"StreakCalc Error: Invalid earliest log date '{earliest_log_date_str}'.")
-                return (0,0)
-        except Exception as e:
-            print(f"StreakCalc Error: Processing earliest log date '{earliest_log_date_str}': {e}")
-            return (0,0)
 
+        # Правило "выполнено" и подсчет по дням считает SQLite (как для heatmap), а не Python на каждую
+        # пару (день, привычка). Дни без логов не бывают успешными, так что нужны только дни со счетчиком.
         today_q_date = QDate.currentDate()
+        done_counts = self.get_daily_done_counts("0000-01-01", today_q_date.toString("yyyy-MM-dd"))
 
-        while loop_q_date <= today_q_date:
-            date_str_iter = loop_q_date.toString("yyyy-MM-dd")
-            num_done_this_day = 0
-            logs_for_current_day = logs_by_date.get(date_str_iter, {})
+        # Успешные дни как номера юлианских дней: серия = подряд идущие целые числа
+        successful_days = []
+        for date_str, num_done_this_day in done_counts: # ordered by date
+            if (num_done_this_day / total_configurable_habits) > 0.75:
+                successful_days.append(QDate.fromString(date_str, "yyyy-MM-dd").toJulianDay())
 
-            for habit_id, details in habit_details_map.items():
-                logged_value = logs_for_current_day.get(habit_id)
-                if self._is_habit_done_for_global_streak(logged_value, details["type"], details["goal"]):
-                    num_done_this_day += 1
-            
-            is_successful_day = False
-            if total_configurable_habits > 0: # Should always be true here
-                if (num_done_this_day / total_configurable_habits) > 0.75:
-                    is_successful_day = True
-            
-            if is_successful_day:
+        max_s = 0
+        running_s = 0
+        previous_day = None
+        for day in successful_days:
+            if previous_day is not None and day == previous_day + 1:
                 running_s += 1
             else:
-                max_s = max(max_s, running_s) # Store streak before resetting
-                running_s = 0
-            
-            if loop_q_date == today_q_date: # If today has been processed
-                current_s = running_s
-            
-            loop_q_date = loop_q_date.addDays(1)
-        
-        max_s = max(max_s, running_s) # Final check for max_streak
+                running_s = 1 # Пропуск: новая серия
+            max_s = max(max_s, running_s)
+            previous_day = day
 
-        # If today was not successful, current_s (which is running_s) would be 0.
-        # If today was successful, current_s holds the ongoing streak.
-        # If there are no logs for today, the loop still processes today as an "unsuccessful" day
-        # (num_done_this_day will be 0), correctly setting running_s to 0.
-        print(f"StreakCalc: Current={current_s}, Max={max_s} (TotalHabits={total_configurable_habits})")
+        # Текущая серия жива, только если сегодня успешный день
+        current_s = running_s if previous_day == today_q_date.toJulianDay() else 0
+        log.debug("StreakCalc: Current=%s, Max=%s (TotalHabits=%s)", current_s, max_s, total_configurable_habits)
         return (current_s, max_s)
 
     def update_time_entry(self, entry_id, new_duration_seconds=None, new_timestamp_qdatetime=None, new_entry_type=None):
@@ -643,7 +809,7 @@ class DatabaseManager:
 
         if new_duration_seconds is not None:
             if int(new_duration_seconds) <= 0:
-                print("Error: New duration must be positive.")
+                log.error("Error: New duration must be positive.")
                 return False
             fields_to_update.append("duration_seconds = ?")
             params.append(int(new_duration_seconds))
@@ -654,18 +820,18 @@ class DatabaseManager:
             fields_to_update.append("timestamp = ?")
             params.append(timestamp_str_utc)
         elif new_timestamp_qdatetime is not None: 
-             print(f"Warning: Invalid QDateTime provided for timestamp update of entry {entry_id}. Timestamp not updated.")
+             log.warning("Warning: Invalid QDateTime provided for timestamp update of entry %s. Timestamp not updated.", entry_id)
 
 
         if new_entry_type is not None:
             if new_entry_type not in ('work', 'break'):
-                print(f"Error: Invalid entry_type '{new_entry_type}'. Must be 'work' or 'break'.")
+                log.error("Error: Invalid entry_type '%s'. Must be 'work' or 'break'.", new_entry_type)
                 return False
             fields_to_update.append("entry_type = ?")
             params.append(new_entry_type)
 
         if not fields_to_update:
-            print(f"No valid fields provided to update for entry ID {entry_id}.")
+            log.debug("No valid fields provided to update for entry ID %s.", entry_id)
             return False 
 
         params.append(entry_id) 
@@ -673,17 +839,18 @@ class DatabaseManager:
         sql = f"UPDATE time_entries SET {', '.join(fields_to_update)} WHERE id = ?"
 
         try:
-            print(f"Executing SQL for update: {sql} with params {params}") 
+            log.debug("Executing SQL for update: %s with params %s", sql, params) 
             self.cursor.execute(sql, tuple(params))
             self.conn.commit()
+            self.entries_version += 1
             if self.cursor.rowcount > 0:
-                print(f"Time entry ID {entry_id} updated successfully. Fields: {fields_to_update}")
+                log.debug("Time entry ID %s updated successfully. Fields: %s", entry_id, fields_to_update)
                 return True
             else:
-                print(f"Time entry ID {entry_id} not found for update, or no data changed.")
+                log.debug("Time entry ID %s not found for update, or no data changed.", entry_id)
                 return False 
         except sqlite3.Error as e:
-            print(f"Error updating time entry ID {entry_id}: {e}")
+            log.error("Error updating time entry ID %s: %s", entry_id, e)
             self.conn.rollback()
             return False    
         
@@ -693,14 +860,15 @@ class DatabaseManager:
         try:
             self.cursor.execute("DELETE FROM time_entries WHERE id = ?", (entry_id,))
             self.conn.commit()
+            self.entries_version += 1
             if self.cursor.rowcount > 0:
-                print(f"Time entry ID {entry_id} deleted.")
+                log.debug("Time entry ID %s deleted.", entry_id)
                 return True
             else:
-                print(f"Time entry ID {entry_id} not found for deletion.")
+                log.debug("Time entry ID %s not found for deletion.", entry_id)
                 return False
         except sqlite3.Error as e:
-            print(f"Error deleting time entry: {e}")
+            log.error("Error deleting time entry: %s", e)
             return False
 
     def update_activity_name(self, activity_id, new_name, parent_id):
@@ -709,42 +877,49 @@ class DatabaseManager:
         new_name = new_name.strip()
         if not new_name: return False
 
-        if self._check_activity_name_exists(new_name, parent_id):
-             self.cursor.execute("SELECT id FROM activities WHERE name = ? AND (parent_id = ? OR (parent_id IS NULL AND ? IS NULL))", (new_name, parent_id, parent_id))
-             existing = self.cursor.fetchone()
+        if not self._activity_names_unique and self._check_activity_name_exists(new_name, parent_id):
+             existing = self.conn.execute("SELECT id FROM activities WHERE name = ? AND (parent_id = ? OR (parent_id IS NULL AND ? IS NULL))", (new_name, parent_id, parent_id)).fetchone()
              if existing and existing[0] != activity_id:
-                 print(f"Cannot rename: Activity '{new_name}' already exists.")
+                 log.warning("Cannot rename: Activity '%s' already exists.", new_name)
                  QMessageBox.warning(None, "Duplicate", f"An activity named '{new_name}' already exists in this branch.")
                  return False
         try:
-            self.cursor.execute("UPDATE activities SET name = ? WHERE id = ?", (new_name, activity_id))
+            # With idx_activities_name_parent a clash with a sibling's name is skipped by SQLite (rowcount 0)
+            self.cursor.execute("UPDATE OR IGNORE activities SET name = ? WHERE id = ?", (new_name, activity_id))
+            renamed = self.cursor.rowcount > 0
             self.conn.commit()
-            if self.cursor.rowcount > 0:
-                print(f"Activity ID {activity_id} renamed to '{new_name}'.")
+            if renamed:
+                self.activity_version += 1
+                log.debug("Activity ID %s renamed to '%s'.", activity_id, new_name)
                 return True
+            # Ничего не изменено: либо такой активности нет, либо имя занято (дополнительный запрос только здесь)
+            if self.conn.execute("SELECT 1 FROM activities WHERE id = ?", (activity_id,)).fetchone() is None:
+                log.debug("Activity ID %s not found for renaming.", activity_id)
             else:
-                print(f"Activity ID {activity_id} not found for renaming.")
-                return False
+                log.warning("Cannot rename: Activity '%s' already exists.", new_name)
+                QMessageBox.warning(None, "Duplicate", f"An activity named '{new_name}' already exists in this branch.")
+            return False
         except sqlite3.Error as e:
-            print(f"Error renaming activity: {e}")
+            log.error("Error renaming activity: %s", e)
             return False
 
     def delete_activity(self, activity_id):
         """Deletes an activity and all its descendants (CASCADE handles related)."""
         if not self.conn or not activity_id: return False
-        descendant_ids = self.get_descendant_activity_ids(activity_id)
-        if not descendant_ids:
-             print(f"Failed to get descendants for deleting activity ID {activity_id}.")
-             return False
         try:
-            placeholders = ', '.join('?' * len(descendant_ids))
-            self.cursor.execute(f"DELETE FROM activities WHERE id IN ({placeholders})", list(descendant_ids))
+            # Сначала самые глубокие: иначе ON DELETE SET NULL на мгновение поднимает ребенка на верхний уровень,
+            # и он может совпасть по имени с существующей активностью верхнего уровня (idx_activities_name_parent).
+            # Один неизменный текст SQL (кэш подготовленных запросов) при любом числе потомков.
+            branch_ids = self.conn.execute(_SQL_ACTIVITY_BRANCH_DEEPEST_FIRST, {'aid': activity_id}).fetchall()
+            self.cursor.executemany(_SQL_DELETE_ACTIVITY, branch_ids)
             deleted_count = self.cursor.rowcount
             self.conn.commit()
-            print(f"Activity ID {activity_id} and descendants deleted ({deleted_count} total).")
+            self.activity_version += 1
+            self.entries_version += 1 # записи удаляются каскадно
+            log.debug("Activity ID %s and descendants deleted (%s total).", activity_id, deleted_count)
             return True
         except sqlite3.Error as e:
-            print(f"Error deleting activity and descendants: {e}")
+            log.error("Error deleting activity and descendants: %s", e)
             self.conn.rollback()
             return False
 
@@ -752,11 +927,10 @@ class DatabaseManager:
         """Gets the parent_id for a given activity."""
         if not self.conn or not activity_id: return None
         try:
-            self.cursor.execute("SELECT parent_id FROM activities WHERE id = ?", (activity_id,))
-            result = self.cursor.fetchone()
+            result = self.conn.execute("SELECT parent_id FROM activities WHERE id = ?", (activity_id,)).fetchone()
             return result[0] if result else None
         except sqlite3.Error as e:
-            print(f"Error retrieving parent_id for activity {activity_id}: {e}")
+            log.error("Error retrieving parent_id for activity %s: %s", activity_id, e)
             return None
 
     def set_activity_habit_config(self, activity_id, habit_type, habit_unit=None, habit_goal=None): # Add habit_goal parameter
@@ -793,12 +967,11 @@ class DatabaseManager:
 
             if is_newly_enabled:
                 # Calculate next sort order
-                self.cursor.execute("SELECT MAX(habit_sort_order) FROM activities WHERE habit_sort_order IS NOT NULL")
-                max_order_result = self.cursor.fetchone()
+                max_order_result = self.conn.execute("SELECT MAX(habit_sort_order) FROM activities WHERE habit_sort_order IS NOT NULL").fetchone()
                 max_order = max_order_result[0] if max_order_result and max_order_result[0] is not None else -1 # Handle NULL/no rows
                 sort_order = max_order + 1
                 sort_order_sql = ", habit_sort_order = ?" # Add sort order to UPDATE
-                print(f"Assigning initial sort order {sort_order} to new habit ID {activity_id}")
+                log.debug("Assigning initial sort order %s to new habit ID %s", sort_order, activity_id)
                 params = (habit_type, habit_unit, final_habit_goal, sort_order, activity_id) # Add sort_order param
             else:
                 # Modifying existing habit (type/unit/goal only)
@@ -807,13 +980,14 @@ class DatabaseManager:
             update_sql = f"UPDATE activities SET habit_type = ?, habit_unit = ?, habit_goal = ?{sort_order_sql} WHERE id = ?"
 
         try:
-            print(f"Executing SQL: {update_sql} with params {params}")
+            log.debug("Executing SQL: %s with params %s", update_sql, params)
             self.cursor.execute(update_sql, params)
             self.conn.commit()
-            print(f"Habit config updated for activity {activity_id}. Rows affected: {self.cursor.rowcount}")
+            self.activity_version += 1
+            log.debug("Habit config updated for activity %s. Rows affected: %s", activity_id, self.cursor.rowcount)
             return self.cursor.rowcount > 0
         except sqlite3.Error as e:
-            print(f"Error updating habit config for activity {activity_id}: {e}")
+            log.error("Error updating habit config for activity %s: %s", activity_id, e)
             self.conn.rollback()
             return False
 
@@ -822,12 +996,11 @@ class DatabaseManager:
         if not self.conn or not activity_id: return (None, None, None) # Return tuple of 3
         try:
             # Select the new habit_goal column
-            self.cursor.execute("SELECT habit_type, habit_unit, habit_goal FROM activities WHERE id = ?", (activity_id,))
-            result = self.cursor.fetchone()
+            result = self.conn.execute("SELECT habit_type, habit_unit, habit_goal FROM activities WHERE id = ?", (activity_id,)).fetchone()
             # Return type, unit, goal
             return (result[0], result[1], result[2]) if result else (None, None, None)
         except sqlite3.Error as e:
-            print(f"Error retrieving habit config for activity {activity_id}: {e}")
+            log.error("Error retrieving habit config for activity %s: %s", activity_id, e)
             return (None, None, None)
 
     def get_all_habits(self):
@@ -842,57 +1015,112 @@ class DatabaseManager:
             # Returns list of tuples: [(id, name, type, unit, goal), ...]
             return self.cursor.fetchall()
         except sqlite3.Error as e:
-            print(f"Error retrieving all habits: {e}")
+            log.error("Error retrieving all habits: %s", e)
             return []
 
 
     def log_habit(self, activity_id, date_str, value):
         """Logs or updates a habit entry for a specific date using UPSERT logic."""
-        if not self.conn or activity_id is None or not date_str: return False
-        try: QDate.fromString(date_str, "yyyy-MM-dd") # Basic date validation
-        except ValueError: print(f"Error: Invalid date format '{date_str}'."); return False
+        return self.log_habits([(activity_id, date_str, value)]) == 1
+
+    def log_habits(self, rows):
+        """
+        Logs/updates several habit entries in one transaction (executemany, one commit).
+        rows: iterable of (activity_id, date_str, value); value None deletes that day's log.
+        Returns the number of rows applied (0 on error).
+        """
+        if not self.conn: return 0
+        upserts, deletes = [], []
+        for activity_id, date_str, value in rows:
+            if activity_id is None or not date_str: continue
+            if value is None: deletes.append((activity_id, date_str))
+            else: upserts.append((activity_id, date_str, float(value)))
+        if not upserts and not deletes: return 0
+
         try:
-            if value is None:
-                 self.cursor.execute("DELETE FROM habit_logs WHERE activity_id = ? AND log_date = ?", (activity_id, date_str))
-                 print(f"Habit log deleted for Activity ID {activity_id} on {date_str}")
-            else:
-                 self.cursor.execute("INSERT OR REPLACE INTO habit_logs (activity_id, log_date, value) VALUES (?, ?, ?)",
-                                     (activity_id, date_str, float(value)))
-                 print(f"Habit logged for Activity ID {activity_id} on {date_str} with value {value}")
-            self.conn.commit(); return True
+            # Явная транзакция с отложенной проверкой FK: ссылки на activities проверяются один раз
+            # при COMMIT, а не прерывают пакет на первой строке (pragma сбрасывается сама на COMMIT/ROLLBACK)
+            self.cursor.execute("BEGIN TRANSACTION")
+            self.cursor.execute("PRAGMA defer_foreign_keys = ON")
+            if deletes: self.cursor.executemany(_SQL_DELETE_HABIT_LOG, deletes)
+            if upserts: self.cursor.executemany(_SQL_UPSERT_HABIT_LOG, upserts)
+            self.conn.commit()
+            log.debug("Habit logs applied: %s upserted, %s deleted.", len(upserts), len(deletes))
+            return len(upserts) + len(deletes)
         except sqlite3.Error as e:
-            print(f"Error logging habit for activity {activity_id} on {date_str}: {e}")
-            self.conn.rollback(); return False
+            log.error("Error logging habits (%s rows): %s", len(upserts) + len(deletes), e)
+            self.conn.rollback(); return 0
+
+    def get_habit_log_value(self, activity_id, date_str):
+        """Gets one habit's logged value for a date (None if not logged).
+        Seeks the UNIQUE(activity_id, log_date) index instead of reading every habit's log for that day."""
+        if not self.conn or activity_id is None or not date_str: return None
+        try:
+            row = self.conn.execute(_SQL_HABIT_LOG_VALUE, (activity_id, date_str)).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            log.error("Error retrieving habit log for activity %s on %s: %s", activity_id, date_str, e)
+            return None
 
-    def get_habit_logs_for_month(self, year, month):
-        """Gets all habit logs for a given year and month."""
+    def get_habit_log_rows_for_month(self, year, month):
+        """
+        Gets a month's habit logs as {activity_id: array('d') of one value per day} (index = day - 1),
+        with NaN for days that are not logged. Each row is a dense block of raw doubles (8 bytes a day,
+        no float objects); year/month are implied, so no tuple key or date string is kept per log.
+        """
         if not self.conn: return {}
-        month_pattern = f"{year:04d}-{month:02d}-%"
+        # Полуоткрытый диапазон вместо LIKE: LIKE не использует индекс по log_date
+        month_start = f"{year:04d}-{month:02d}-01"
+        next_month_start = f"{year + 1:04d}-01-01" if month == 12 else f"{year:04d}-{month + 1:02d}-01"
+        days_in_month = QDate(year, month, 1).daysInMonth()
+        rows = {}
         try:
-            self.cursor.execute("SELECT activity_id, log_date, value FROM habit_logs WHERE log_date LIKE ?", (month_pattern,))
-            return {(row[0], row[1]): row[2] for row in self.cursor.fetchall()}
+            # Свой короткоживущий курсор (не общий self.cursor); fetchmany() chunks: one C call per chunk
+            cursor = self.conn.execute(_SQL_HABIT_LOG_DAYS_MONTH, (month_start, next_month_start))
+            while (chunk := cursor.fetchmany(SQLITE_FETCH_ARRAYSIZE)):
+                for activity_id, day, value in chunk:
+                    day_values = rows.get(activity_id)
+                    if day_values is None:
+                        day_values = rows[activity_id] = array('d', [math.nan]) * days_in_month
+                    day_values[day - 1] = math.nan if value is None else value
+            return rows
         except sqlite3.Error as e:
-            print(f"Error retrieving habit logs for {year}-{month}: {e}")
+            log.error("Error retrieving habit log rows for %s-%s: %s", year, month, e)
             return {}
 
     def update_habit_order(self, ordered_activity_ids):
         """Updates the habit_sort_order for a list of activity IDs."""
         if not self.conn or not ordered_activity_ids: return False
         try:
-            print(f"Updating habit order for {len(ordered_activity_ids)} items...")
-            self.cursor.execute("BEGIN TRANSACTION")
-            for index, activity_id in enumerate(ordered_activity_ids):
-                 self.cursor.execute("UPDATE activities SET habit_sort_order = ? WHERE id = ?", (index, activity_id))
-            self.cursor.execute("COMMIT TRANSACTION")
-            print("Habit order updated successfully."); return True
+            # Пишем только строки, у которых порядок действительно изменился (обычно 2 из N при перетаскивании)
+            current_order = dict(self.conn.execute("SELECT id, habit_sort_order FROM activities WHERE habit_type IS NOT NULL"))
+            changes = [(activity_id, index) for index, activity_id in enumerate(ordered_activity_ids)
+                       if current_order.get(activity_id) != index]
+            log.debug("Updating habit order: %s of %s items changed.", len(changes), len(ordered_activity_ids))
+            if not changes: return True
+            # Один UPDATE на пачку: новые позиции приходят таблицей VALUES (текст SQL растет линейно,
+            # каждый id передается один раз, в отличие от CASE id WHEN ... + IN (...)); один commit
+            for start in range(0, len(changes), HABIT_ORDER_UPDATE_CHUNK):
+                chunk = changes[start:start + HABIT_ORDER_UPDATE_CHUNK]
+                values_sql = ", ".join(["(?, ?)"] * len(chunk))
+                self.conn.execute(
+                    f"WITH new_order(id, ord) AS (VALUES {values_sql}) "
+                    "UPDATE activities SET habit_sort_order = (SELECT ord FROM new_order WHERE new_order.id = activities.id) "
+                    "WHERE id IN (SELECT id FROM new_order)",
+                    [value for pair in chunk for value in pair])
+            self.conn.commit()
+            log.debug("Habit order updated successfully."); return True
         except sqlite3.Error as e:
-            print(f"Error updating habit order: {e}")
-            self.cursor.execute("ROLLBACK TRANSACTION"); return False
+            log.error("Error updating habit order: %s", e)
+            self.conn.rollback(); return False
 
     def close(self):
         if self.conn:
+            # Рекомендация SQLite: перед закрытием обновить статистику планировщика (обычно no-op)
+            try: self.conn.execute("PRAGMA optimize")
+            except sqlite3.Error as e: log.warning("PRAGMA optimize failed: %s", e)
             self.conn.close()
-            print("Database disconnected.")
+            log.debug("Database disconnected.")
 # --- End of DatabaseManager Class ---
 
 # =============================================================
@@ -916,7 +1144,7 @@ class HeatmapWidget(QWidget):
         super().__init__(parent)
         self.db_manager = db_manager
         self.year = QDate.currentDate().year()
-        self.daily_done_counts = defaultdict(int) # {QDate: count}
+        self.daily_done_counts = {} # {day of year (1-based int): count}, only days with count > 0
         self.max_done_count = 1 # Not currently used for coloring, but kept
         self.habit_configs = {} # {activity_id: (type, unit, goal)}
 
@@ -931,17 +1159,36 @@ class HeatmapWidget(QWidget):
 
         self.start_date = QDate(self.year, 1, 1)
         self.end_date = QDate(self.year, 12, 31)
+        # Day of year of each month's 1st: 'YYYY-MM-DD' -> day of year and back in plain ints, no QDate per cell
+        self._month_first_day = tuple(QDate(self.year, month, 1).dayOfYear() for month in range(1, 13))
 
         # --- Precalculated Layout Data ---
-        self._cell_rects = {} # {QDate: QRectF} Store calculated cell positions
+        self._cell_rects = {} # {day of year: QRectF} Store calculated cell positions (int keys hash natively)
+        self._cell_paths = {} # {day of year: QPainterPath} Rounded cell outlines, rebuilt only with the layout
+        # Cells pre-grouped for paintEvent (rebuilt on layout/data change or when the day rolls over):
+        self._static_layer = None # QPixmap with labels, future and nothing-done cells; rebuilt with the groups
+        self._done_items = [] # [(QPainterPath, QRectF, QPointF, QStaticText)] past days with habits done
+        self._day_static_texts = {} # {day_of_month: QStaticText} "1".."31" laid out once for the day font
+        self._done_paths_by_color = {} # {(saturation, lightness): [QPainterPath]} the same done days, by completion level
+        self._done_bbox = QRect() # Union of done cells: the only area the animation changes
+        self._paint_style_dirty = True # Pens/colors/fonts below are rebuilt from palette/font when set
+        self._stamp_dpr = 0.0 # devicePixelRatio the cell stamp pixmaps were rendered for
+        self._paint_groups_date = None # QDate the groups were built for; None = rebuild needed
+        # One gradient in cell-relative coordinates (0,0 -> 1,1 = topLeft -> bottomRight of whatever is
+        # filled) and two colors, updated in place: a frame needs one brush per distinct saturation/lightness
+        self._cell_gradient = QLinearGradient(0, 0, 1, 1)
+        self._cell_gradient.setCoordinateMode(QGradient.CoordinateMode.ObjectBoundingMode)
+        self._gradient_color1 = QColor()
+        self._gradient_color2 = QColor()
         self._month_labels = [] # List of (QPointF, str) for month label positions/text
         self._weekday_labels = [] # List of (QPointF, str) for weekday label positions/text
         self._needs_layout_update = True # Flag to recalculate geometry on resize/show
 
         # --- Animation Timer ---
         self.heatmap_animation_timer = QTimer(self)
-        self.heatmap_animation_timer.timeout.connect(self.update) # Trigger repaint for animation
-        # Timer started in showEvent
+        self.heatmap_animation_timer.timeout.connect(self._on_animation_tick) # Repaint only the animated cells
+        # Timer started in showEvent, paused while the window is inactive (see _sync_animation_timer)
+        self._activation_window = None # Top-level window whose (de)activation we watch
 
         self.setMinimumSize(self._calculate_minimum_size())
         self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed) # Expands horizontally
@@ -973,6 +1220,7 @@ class HeatmapWidget(QWidget):
         """Calculates positions for cells and labels based on current widget size."""
         print("Recalculating heatmap layout...") # Добавим отладочный вывод
         self._cell_rects = {}
+        self._cell_paths = {}
         self._month_labels = []
         self._weekday_labels = [] # Очищаем список перед заполнением
 
@@ -1040,19 +1288,24 @@ class HeatmapWidget(QWidget):
         # --- Calculate Day Cell Rects (No changes needed here) ---
         start_x = float(self.weekday_label_width + self.cell_spacing)
         start_y = float(self.month_label_height + self.cell_spacing)
-        current_date = self.start_date
-        while current_date <= self.end_date:
-            day_of_week_index = current_date.dayOfWeek() - 1 # 0 to 6
-            first_day_weekday = self.start_date.dayOfWeek()
-            col = (current_date.dayOfYear() + first_day_weekday - 2) // 7
-            row = day_of_week_index
-
-            x = start_x + col * (self.cell_size + self.cell_spacing)
-            y = start_y + row * (self.cell_size + self.cell_spacing)
-            self._cell_rects[current_date] = QRectF(x, y, float(self.cell_size), float(self.cell_size))
-            current_date = current_date.addDays(1)
+        # Колонка/строка считаются в целых числах от дня года, он же ключ ячейки
+        first_day_weekday = self.start_date.dayOfWeek() # 1 (Mon) .. 7 (Sun)
+        step = self.cell_size + self.cell_spacing
+        for day_index in range(self.start_date.daysInYear()): # 0-based day of year
+            col, row = divmod(day_index + first_day_weekday - 1, 7) # row 0..6 = Mon..Sun
+
+            x = start_x + col * step
+            y = start_y + row * step
+            cell_rect = QRectF(x, y, float(self.cell_size), float(self.cell_size))
+            day_of_year = day_index + 1
+            self._cell_rects[day_of_year] = cell_rect
+            # Путь ячейки статичен между пересчетами layout: строим один раз, а не на каждом кадре анимации
+            path = QPainterPath()
+            path.addRoundedRect(cell_rect, self.cell_radius, self.cell_radius)
+            self._cell_paths[day_of_year] = path
 
         self._needs_layout_update = False
+        self._paint_groups_date = None # Пути/прямоугольники изменились
         print("Heatmap layout recalculation finished.")
     def resizeEvent(self, event):
         """Mark layout as needing update on resize."""
@@ -1086,153 +1339,222 @@ class HeatmapWidget(QWidget):
              self._needs_layout_update = True # Need layout even if empty
              return
 
-        # Fetch all logs for the entire year for efficiency
-        logs = self.db_manager.get_habit_logs_for_date_range(
+        # Done counts for the whole year, already reduced per day by SQLite
+        done_counts = self.db_manager.get_daily_done_counts(
              self.start_date.toString("yyyy-MM-dd"), self.end_date.toString("yyyy-MM-dd"))
 
-        self._calculate_daily_done_counts(logs)
+        self._calculate_daily_done_counts(done_counts)
         print(f"HeatmapWidget: Data loaded. Calculated done counts for {len(self.daily_done_counts)} days.")
         self._needs_layout_update = True # Recalculate layout after data load
 
-    def _is_habit_done(self, activity_id, value):
-        """Checks if a specific habit is considered 'done' based on its type, goal, and logged value."""
-        if value is None: return False
-        if activity_id not in self.habit_configs: return False
-        habit_type, _, habit_goal = self.habit_configs[activity_id]
-
-        if habit_type == HABIT_TYPE_BINARY: return value == 1.0
-        elif habit_type == HABIT_TYPE_PERCENTAGE: return value >= 100.0
-        elif habit_type == HABIT_TYPE_NUMERIC:
-            # Done if a positive goal exists and the value meets or exceeds it
-            return habit_goal is not None and habit_goal > 0 and value >= habit_goal
-        else: return False # Unknown type or not a habit
-
-    def _calculate_daily_done_counts(self, logs):
-        """Calculates how many habits were 'done' for each day of the year."""
-        self.daily_done_counts = defaultdict(int)
+    def _calculate_daily_done_counts(self, done_counts):
+        """Stores the per-day done counts [(date_str, count)] from get_daily_done_counts by day of year."""
+        self.daily_done_counts = {}
         temp_max_done = 0
-        current_date = self.start_date
-        today = QDate.currentDate()
+        today_str = QDate.currentDate().toString("yyyy-MM-dd")
 
-        while current_date <= self.end_date:
-            date_str = current_date.toString("yyyy-MM-dd")
-            done_count_for_day = 0
-            for habit_id in self.habit_configs.keys():
-                 log_value = logs.get((habit_id, date_str)) # Get log for this habit/date
-                 if self._is_habit_done(habit_id, log_value):
-                     done_count_for_day += 1
-
-            # Store count only if > 0 to keep dict smaller, or store 0s too?
-            # Storing only > 0 is fine as .get(date, 0) handles missing keys later.
-            if done_count_for_day > 0:
-                 self.daily_done_counts[current_date] = done_count_for_day
-                 # Track max done count only for past/present days for gradient scaling (optional)
-                 if current_date <= today:
-                     temp_max_done = max(temp_max_done, done_count_for_day)
-
-            current_date = current_date.addDays(1)
+        # День года из 'YYYY-MM-DD' целочисленно (логи уже ограничены годом), без QDate.fromString.
+        # Only days with count > 0 are stored: .get(day, 0) handles missing keys later.
+        month_first_day = self._month_first_day
+        for date_str, done_count_for_day in done_counts:
+            day_of_year = month_first_day[int(date_str[5:7]) - 1] + int(date_str[8:10]) - 1
+            self.daily_done_counts[day_of_year] = done_count_for_day
+            # Track max done count only for past/present days for gradient scaling (optional)
+            if date_str <= today_str:
+                temp_max_done = max(temp_max_done, done_count_for_day)
         # self.max_done_count = max(1, temp_max_done) # Not used currently, but available
+        self._paint_groups_date = None # Новые счетчики: перегруппировать ячейки при следующей отрисовке
+
+    def _build_paint_groups(self, today):
+        """Splits the cells into future / nothing-done / done groups for paintEvent, so the per-frame
+        loop does no date comparison, dict lookup or day-number formatting per cell.
+        Future and nothing-done cells never animate: they go straight into the static layer pixmap."""
+        future_items = [] # [QPointF stamp pos]
+        zero_items = [] # [(QPointF stamp pos, QPointF, QStaticText)]
+        self._done_items = []
+        self._done_paths_by_color = {}
+        total_habits = len(self.habit_configs) if self.habit_configs else 1
+        # Все дни года после today_day - будущие (другой год: все прошлые или все будущие)
+        if today.year() == self.year: today_day = today.dayOfYear()
+        else: today_day = 0 if today.year() < self.year else 367
+        month_first_day = self._month_first_day
+        for day_of_year, cell_rect in self._cell_rects.items():
+            if not cell_rect: continue
+            path = self._cell_paths[day_of_year]
+            # Статичные ячейки (будущие и пустые) не рисуются путем: копируем готовый штамп, см. _build_cell_stamp
+            stamp_pos = QPointF(cell_rect.x() - CELL_STAMP_MARGIN, cell_rect.y() - CELL_STAMP_MARGIN)
+            if day_of_year > today_day:
+                future_items.append(stamp_pos)
+                continue
+            done_count = self.daily_done_counts.get(day_of_year, 0)
+            # Номер дня: готовый QStaticText (раскладка глифов закэширована), центрированный в ячейке
+            day_of_month = day_of_year - month_first_day[bisect_right(month_first_day, day_of_year) - 1] + 1
+            day_text = self._day_static_texts[day_of_month]
+            text_size = day_text.size()
+            day_pos = QPointF(cell_rect.x() + (cell_rect.width() - text_size.width()) / 2.0,
+                              cell_rect.y() + (cell_rect.height() - text_size.height()) / 2.0)
+            if done_count == 0:
+                zero_items.append((stamp_pos, day_pos, day_text))
+            else:
+                percentage_done = min(done_count / total_habits, 1.0) if total_habits > 0 else 0.0
+                # Adjust saturation/lightness based on percentage
+                # Lower base saturation/lightness might look better with black text
+                saturation = max(0, min(255, 80 + int(percentage_done * 150))) # e.g., 80 -> 230
+                lightness = max(0, min(255, 210 - int(percentage_done * 50))) # e.g., 210 -> 160 (lighter base)
+                self._done_items.append((path, cell_rect, day_pos, day_text))
+                self._done_paths_by_color.setdefault((saturation, lightness), []).append(path)
+        done_bbox = QRectF()
+        for _, cell_rect, _, _ in self._done_items:
+            done_bbox = done_bbox.united(cell_rect)
+        if done_bbox.isEmpty():
+            self._done_bbox = QRect() # Нет выполненных дней: тик анимации ничего не перерисовывает (отступ дал бы 2x2)
+        else:
+            self._done_bbox = done_bbox.toAlignedRect().adjusted(-1, -1, 1, 1) # + antialiased outline
+        self._static_layer = self._build_static_layer(future_items, zero_items)
+        self._paint_groups_date = today
+
+    def _build_static_layer(self, future_items, zero_items):
+        """Renders everything that does not animate (month/weekday labels, future and nothing-done cells)
+        into one widget-sized pixmap, so paintEvent blits it instead of issuing hundreds of draw calls."""
+        dpr = self._stamp_dpr
+        layer = QPixmap(math.ceil(self.width() * dpr), math.ceil(self.height() * dpr))
+        layer.setDevicePixelRatio(dpr)
+        layer.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(layer)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing, False)
+        painter.setRenderHint(QPainter.RenderHint.TextAntialiasing, True)
+
+        # --- Month and Weekday Labels ---
+        painter.setPen(self._label_color)
+        painter.setFont(self._month_font)
+        for pos, text in self._month_labels:
+             painter.drawText(pos, text)
+        painter.setFont(self.font())
+        for pos, text in self._weekday_labels:
+             painter.drawText(pos, text)
+
+        # Future dates: faint outline only
+        future_stamp = self._future_stamp
+        for stamp_pos in future_items:
+            painter.drawPixmap(stamp_pos, future_stamp)
+
+        # Past or today, nothing done: base background, theme text color for the day number
+        zero_stamp = self._zero_stamp
+        for stamp_pos, _, _ in zero_items:
+            painter.drawPixmap(stamp_pos, zero_stamp)
+        painter.setFont(self._day_font)
+        painter.setPen(self._text_color_not_done)
+        for _, day_pos, day_text in zero_items:
+            painter.drawStaticText(day_pos, day_text)
+        painter.end()
+        return layer
+
+    def _build_paint_style(self):
+        """Creates the pens, colors and fonts paintEvent uses; they depend only on palette and font."""
+        palette = self.palette() # Get current theme palette
+        # --- Define Colors (adapt better to theme) ---
+        self._pen_future = QPen(palette.color(QPalette.ColorGroup.Normal, QPalette.ColorRole.Window).lighter(115), 0.5)
+        self._pen_past = QPen(palette.color(QPalette.ColorGroup.Normal, QPalette.ColorRole.Mid), 0.5) # Slightly darker outline
+        self._base_past_color = palette.color(QPalette.ColorGroup.Normal, QPalette.ColorRole.Base) # Background for 0 done days
+        self._label_color = palette.color(QPalette.ColorRole.Text) # Month and weekday labels
+        # Color for text when background is the plain base_past_color
+        self._text_color_not_done = palette.color(QPalette.ColorGroup.Normal, QPalette.ColorRole.WindowText) # Should contrast with Base
+        self._text_color_done = QColor(Qt.GlobalColor.black) # <<< FORCED BLACK FONT on gradient
+        self._month_font = QFont(self.font()); self._month_font.setBold(True)
+        self._day_font = QFont(self.font()); self._day_font.setPointSize(self.day_number_font_size)
+        self._day_static_texts = {}
+        for day in range(1, 32):
+            day_text = QStaticText(str(day))
+            day_text.setTextFormat(Qt.TextFormat.PlainText)
+            day_text.setPerformanceHint(QStaticText.PerformanceHint.AggressiveCaching)
+            day_text.prepare(QTransform(), self._day_font)
+            self._day_static_texts[day] = day_text
+        self._stamp_dpr = self.devicePixelRatioF()
+        self._future_stamp = self._build_cell_stamp(self._pen_future, QBrush(Qt.BrushStyle.NoBrush))
+        self._zero_stamp = self._build_cell_stamp(self._pen_past, QBrush(self._base_past_color))
+        self._paint_style_dirty = False
+        self._paint_groups_date = None # Позиции номеров дней зависят от шрифта
+
+    def _build_cell_stamp(self, pen, brush):
+        """Renders one static cell (outline + fill) into a pixmap that paintEvent blits per cell:
+        a pixmap copy is much cheaper than rasterizing an antialiased rounded path every frame."""
+        margin = CELL_STAMP_MARGIN
+        side = self.cell_size + 2 * margin
+        stamp = QPixmap(math.ceil(side * self._stamp_dpr), math.ceil(side * self._stamp_dpr))
+        stamp.setDevicePixelRatio(self._stamp_dpr)
+        stamp.fill(Qt.GlobalColor.transparent)
+        stamp_painter = QPainter(stamp)
+        stamp_painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        stamp_painter.setPen(pen)
+        stamp_painter.setBrush(brush)
+        stamp_painter.drawRoundedRect(QRectF(margin, margin, self.cell_size, self.cell_size), self.cell_radius, self.cell_radius)
+        stamp_painter.end()
+        return stamp
+
+    def changeEvent(self, event):
+        if event.type() in (QEvent.Type.PaletteChange, QEvent.Type.FontChange, QEvent.Type.StyleChange):
+            self._paint_style_dirty = True
+        elif event.type() == QEvent.Type.ActivationChange: # Heatmap is itself the top-level window
+            self._sync_animation_timer()
+        super().changeEvent(event)
+
+    def eventFilter(self, source, event: QEvent):
+        # Дочерние виджеты получают ActivationChange не всегда (только если палитры Active/Inactive различаются),
+        # поэтому активацию слушаем на самом окне верхнего уровня
+        if source is self._activation_window and event.type() in (QEvent.Type.WindowActivate, QEvent.Type.WindowDeactivate):
+            self._sync_animation_timer()
+        return super().eventFilter(source, event)
+
+    def _on_animation_tick(self):
+        """Animation timer: only the gradient of done cells changes, so repaint just their bounding rect."""
+        if self._needs_layout_update or self._paint_groups_date != QDate.currentDate():
+            self.update() # Группы устарели (новый день/данные/размер): полная перерисовка
+        elif not self._done_bbox.isEmpty():
+            self.update(self._done_bbox)
 
 
     # --- Main Painting Logic ---
     def paintEvent(self, event):
         """Draw the heatmap with animated gradient and day numbers."""
         painter = QPainter(self)
-        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        # Сглаживание только для текста: заливка сотен мелких ячеек с AA дорога и почти незаметна на 16 px.
+        # Статичные ячейки берутся из штампов, которые уже отрисованы со сглаживанием (_build_cell_stamp).
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing, False)
+        painter.setRenderHint(QPainter.RenderHint.TextAntialiasing, True)
 
         if self._needs_layout_update or not self._cell_rects:
             self._calculate_layout()
 
         today = QDate.currentDate()
-        palette = self.palette() # Get current theme palette
-
-        # --- Define Colors (adapt better to theme) ---
-        outline_future_color = palette.color(QPalette.ColorGroup.Normal, QPalette.ColorRole.Window).lighter(115)
-        outline_past_color = palette.color(QPalette.ColorGroup.Normal, QPalette.ColorRole.Mid) # Slightly darker outline
-        base_past_color = palette.color(QPalette.ColorGroup.Normal, QPalette.ColorRole.Base) # Background for 0 done days
-        month_label_color = palette.color(QPalette.ColorRole.Text)
-        weekday_label_color = palette.color(QPalette.ColorRole.Text)
-        # Color for text when background is the plain base_past_color
-        text_color_not_done = palette.color(QPalette.ColorGroup.Normal, QPalette.ColorRole.WindowText) # Should contrast with Base
-
-        # --- Draw Month Labels ---
-        painter.setPen(month_label_color)
-        month_font = QFont(self.font()); month_font.setBold(True); painter.setFont(month_font)
-        for pos, text in self._month_labels:
-             painter.drawText(pos, text)
-        painter.setFont(self.font()) # Restore default font
-
-        # --- Draw Weekday Labels ---
-        painter.setPen(weekday_label_color)
-        for pos, text in self._weekday_labels:
-             painter.drawText(pos, text)
+        if self._paint_style_dirty or self._stamp_dpr != self.devicePixelRatioF(): # Окно перенесли на экран с другим DPR
+            self._build_paint_style()
 
         # --- Draw Day Cells ---
         current_time = time.time()
-        day_font = QFont(self.font())
-        day_font.setPointSize(self.day_number_font_size)
 
-        for date, cell_rect in self._cell_rects.items():
-            if not cell_rect: continue
-
-            path = QPainterPath()
-            path.addRoundedRect(cell_rect, self.cell_radius, self.cell_radius)
-
-            # --- Drawing Logic based on Date ---
-            if date > today:
-                # Future date: Faint outline only for the cell
-                painter.setPen(QPen(outline_future_color, 0.5))
-                painter.setBrush(Qt.BrushStyle.NoBrush)
+        if self._paint_groups_date != today:
+            self._build_paint_groups(today)
+
+        # Labels, future and nothing-done cells: one blit, clipped to the update region by Qt
+        painter.drawPixmap(QPointF(0, 0), self._static_layer)
+
+        # Past or today, habits done: animated gradient background, BLACK day number
+        painter.setPen(self._pen_past)
+        hue1 = int(current_time * 150) % 360
+        hue2 = (hue1 + 40) % 360
+        gradient, color1, color2 = self._cell_gradient, self._gradient_color1, self._gradient_color2
+        # Кадр меняет только общий оттенок: по одной кисти на уровень выполнения, без работы на ячейку
+        for (saturation, lightness), paths in self._done_paths_by_color.items():
+            color1.setHsl(hue1, saturation, lightness)
+            color2.setHsl(hue2, saturation, lightness)
+            gradient.setColorAt(0, color1); gradient.setColorAt(1, color2)
+            painter.setBrush(QBrush(gradient))
+            for path in paths:
                 painter.drawPath(path)
-            else:
-                # Past or today: Fill based on done_count + Draw Day Number
-                done_count = self.daily_done_counts.get(date, 0) # Default to 0 if no entry
-                painter.setPen(QPen(outline_past_color, 0.5)) # Cell outline for past days
-
-                # --- Determine Background and Text Color ---
-                if done_count == 0:
-                    # Not Done: Use theme's default text color for this background
-                    day_number_text_color = text_color_not_done
-
-                    # Draw background for 0 done
-                    painter.setBrush(base_past_color)
-                    painter.drawPath(path)
-                else:
-                    # Done (Gradient Background): Force text color to BLACK
-                    day_number_text_color = Qt.GlobalColor.black # <<< FORCED BLACK FONT
-
-                    # --- Gradient Calculation ---
-                    total_habits = len(self.habit_configs) if self.habit_configs else 1
-                    percentage_done = min(done_count / total_habits, 1.0) if total_habits > 0 else 0.0
-                    hue1 = int(current_time * 150) % 360
-                    hue2 = (hue1 + 40) % 360
-                    # Adjust saturation/lightness based on percentage
-                    # Lower base saturation/lightness might look better with black text
-                    base_saturation = 80
-                    base_lightness = 210 # Make base lighter
-                    saturation = base_saturation + int(percentage_done * 150) # e.g., 80 -> 230
-                    lightness = base_lightness - int(percentage_done * 50)  # e.g., 210 -> 160
-                    saturation = max(0, min(255, saturation))
-                    lightness = max(0, min(255, lightness))
-                    color1 = QColor.fromHsl(hue1, saturation, lightness)
-                    color2 = QColor.fromHsl(hue2, saturation, lightness)
-                    gradient = QLinearGradient(cell_rect.topLeft(), cell_rect.bottomRight())
-                    gradient.setColorAt(0, color1); gradient.setColorAt(1, color2)
-                    # --- End Gradient Calculation ---
-
-                    # Draw gradient background
-                    painter.setBrush(QBrush(gradient))
-                    painter.drawPath(path)
-
-                # --- Draw Day Number (NO OUTLINE) ---
-                day_number = date.day()
-                # Call the simplified draw function (only requires text color)
-                self.drawOutlinedText(painter, cell_rect,
-                                      int(Qt.AlignmentFlag.AlignCenter), # Center alignment
-                                      str(day_number),
-                                      day_number_text_color, # Use the determined color
-                                      day_font)
-                # --- End Draw Day Number ---
+        painter.setFont(self._day_font)
+        painter.setPen(self._text_color_done)
+        for _, _, day_pos, day_text in self._done_items:
+            painter.drawStaticText(day_pos, day_text)
 
     # --- Timer Management for Animation ---
     def hideEvent(self, event):
@@ -1243,17 +1565,83 @@ class HeatmapWidget(QWidget):
 
     def showEvent(self, event):
          """Start animation timer when widget is shown."""
-         print("HeatmapWidget shown, starting animation timer.")
+         print("HeatmapWidget shown.")
+         window = self.window()
+         if window is not self._activation_window and window is not self: # Reparented or first show
+             if self._activation_window is not None:
+                 self._activation_window.removeEventFilter(self)
+             window.installEventFilter(self)
+             self._activation_window = window
          # Ensure layout is calculated *before* starting updates if needed
          if self._needs_layout_update or not self._cell_rects:
              self._calculate_layout()
-         # Start timer only if it wasn't already active (prevents multiple starts)
-         if not self.heatmap_animation_timer.isActive():
-             self.heatmap_animation_timer.start(100) # Update interval for animation
+         self._sync_animation_timer()
          # Flag layout update in case size changed while hidden
          self._needs_layout_update = True
          super().showEvent(event)
 
+    def _sync_animation_timer(self):
+         """Runs the animation timer only while the heatmap is visible in the active window:
+         an inactive (background) window would otherwise keep repainting 10 times a second."""
+         should_run = self.isVisible() and self.window().isActiveWindow()
+         if should_run and not self.heatmap_animation_timer.isActive():
+             log.debug("HeatmapWidget: starting animation timer.")
+             self.heatmap_animation_timer.start(100) # Update interval for animation
+         elif not should_run and self.heatmap_animation_timer.isActive():
+             log.debug("HeatmapWidget: window inactive, stopping animation timer.")
+             self.heatmap_animation_timer.stop()
+
+class TimerTimeLabel(QWidget):
+    """
+    Big time readout of TimerWindow. Paints a cached QStaticText and has a constant
+    size hint, so the per-second text change is a plain repaint of this widget:
+    no QLabel sizeHint recomputation or layout invalidation on every tick.
+    """
+    WIDEST_TEXT = "Paused: 00:00:00" # Longest text shown; the height/hint are sized for it
+    BOTTOM_PADDING = 2
+
+    def __init__(self, text="", parent=None):
+        super().__init__(parent)
+        self._static_text = QStaticText(text)
+        self._static_text.setTextFormat(Qt.TextFormat.PlainText)
+        self._text_width = 0
+        self._size_hint = QSize()
+        self._update_metrics()
+
+    def _update_metrics(self):
+        fm = self.fontMetrics()
+        self._text_width = fm.horizontalAdvance(self._static_text.text())
+        self._size_hint = QSize(fm.horizontalAdvance(self.WIDEST_TEXT), fm.height() + self.BOTTOM_PADDING)
+        self.setFixedHeight(self._size_hint.height())
+
+    def changeEvent(self, event):
+        if event.type() == QEvent.Type.FontChange:
+            self._static_text.setText(self._static_text.text()) # Drop the layout cached for the old font
+            self._update_metrics()
+            self.updateGeometry()
+        super().changeEvent(event)
+
+    def sizeHint(self):
+        return self._size_hint
+
+    def text(self):
+        return self._static_text.text()
+
+    def setText(self, text):
+        if text == self._static_text.text():
+            return
+        self._static_text.setText(text)
+        self._text_width = self.fontMetrics().horizontalAdvance(text)
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setFont(self.font())
+        painter.setPen(Qt.GlobalColor.white)
+        x = (self.width() - self._text_width) / 2
+        y = (self.height() - self.BOTTOM_PADDING - self.fontMetrics().height()) / 2
+        painter.drawStaticText(QPointF(x, y), self._static_text)
+
 class TimerWindow(QWidget):
     # Сигналы для MainWindow
     pause_requested = pyqtSignal()
@@ -1264,6 +1652,18 @@ class TimerWindow(QWidget):
     STATE_TRACKING = 0
     STATE_PAUSED = 1
 
+    # Один stylesheet на окно (парсится один раз) вместо отдельного setStyleSheet на каждую метку/кнопку
+    STYLESHEET = """
+        QLabel { color : white; background-color: transparent; }
+        QPushButton {
+            background-color: rgba(85, 85, 85, 180); border: 1px solid #555;
+            color: white; padding: 2px 6px; border-radius: 3px; font-size: 9pt;
+            min-width: 50px;
+        }
+        QPushButton:hover { background-color: rgba(100, 100, 100, 200); }
+        QPushButton:pressed { background-color: rgba(120, 120, 120, 220); }
+    """
+
     def __init__(self, initial_color=QColor(0, 0, 0, 180), parent=None):
         super().__init__(parent)
         self._activity_name = "Activity" # Будет установлено позже
@@ -1272,6 +1672,7 @@ class TimerWindow(QWidget):
         self.state = self.STATE_TRACKING # Начальное состояние
         self.is_overrun = False
         self.overrun_seconds = 0
+        self._last_rendered = None # (state, main text, total text, activity name) last shown
 
         self.setWindowFlags(
             Qt.WindowType.FramelessWindowHint |
@@ -1280,6 +1681,7 @@ class TimerWindow(QWidget):
         )
         self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
         self.setAttribute(Qt.WidgetAttribute.WA_ShowWithoutActivating)
+        self.setStyleSheet(self.STYLESHEET)
 
         # --- Layout ---
         layout = QVBoxLayout(self)
@@ -1292,18 +1694,15 @@ class TimerWindow(QWidget):
         info_font.setPointSize(8)
         self.info_label.setFont(info_font)
         self.info_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.info_label.setStyleSheet("QLabel { color : white; background-color: transparent; }")
         self.info_label.setWordWrap(True)
         layout.addWidget(self.info_label)
 
         # --- Главная метка времени (для текущего интервала или статуса паузы) ---
-        self.time_label = QLabel("00:00:00", self)
+        self.time_label = TimerTimeLabel("00:00:00", self)
         time_font = QFont()
         time_font.setPointSize(16)
         time_font.setBold(True)
         self.time_label.setFont(time_font)
-        self.time_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.time_label.setStyleSheet("QLabel { color : white; background-color: transparent; padding-bottom: 2px; }")
         layout.addWidget(self.time_label)
 
         # --- Кнопки ---
@@ -1313,19 +1712,7 @@ class TimerWindow(QWidget):
         self.resume_button = QPushButton("Resume")
         self.end_button = QPushButton("End")
 
-        button_style = """
-            QPushButton {
-                background-color: rgba(85, 85, 85, 180); border: 1px solid #555;
-                color: white; padding: 2px 6px; border-radius: 3px; font-size: 9pt;
-                min-width: 50px;
-            }
-            QPushButton:hover { background-color: rgba(100, 100, 100, 200); }
-            QPushButton:pressed { background-color: rgba(120, 120, 120, 220); }
-        """
-        # ... (установка стиля и курсора для кнопок как в пред. версии) ...
-        self.pause_button.setStyleSheet(button_style)
-        self.resume_button.setStyleSheet(button_style)
-        self.end_button.setStyleSheet(button_style)
+        # Стиль кнопок и меток задается один раз через TimerWindow.STYLESHEET (ниже)
         self.pause_button.setCursor(Qt.CursorShape.PointingHandCursor)
         self.resume_button.setCursor(Qt.CursorShape.PointingHandCursor)
         self.end_button.setCursor(Qt.CursorShape.PointingHandCursor)
@@ -1411,6 +1798,10 @@ class TimerWindow(QWidget):
         # print(f"DEBUG: TimerWindow '{activity_name}': showTrackingState called with interval='{current_interval_str}', total='{total_work_str}'") # Verbose
         if self.state != self.STATE_TRACKING:
             self._set_internal_state(self.STATE_TRACKING)
+        rendered = (self.STATE_TRACKING, current_interval_str, total_work_str, activity_name)
+        if rendered == self._last_rendered:
+            return # Nothing changed: skip elision, setText/setToolTip and the repaint they schedule
+        self._last_rendered = rendered
         elided_name = self._get_elided_text(self.info_label, activity_name)
         self.info_label.setText(f"{elided_name}\nTotal Work: {total_work_str}")
         self.time_label.setText(current_interval_str)
@@ -1420,6 +1811,10 @@ class TimerWindow(QWidget):
         # print(f"DEBUG: TimerWindow '{activity_name}': showPausedState called with break='{current_break_str}', total='{total_break_str}'") # Verbose
         if self.state != self.STATE_PAUSED:
             self._set_internal_state(self.STATE_PAUSED)
+        rendered = (self.STATE_PAUSED, current_break_str, total_break_str, activity_name)
+        if rendered == self._last_rendered:
+            return
+        self._last_rendered = rendered
         elided_name = self._get_elided_text(self.info_label, activity_name)
         self.info_label.setText(f"{elided_name}\nTotal Pause: {total_break_str}")
         self.time_label.setText(f"Paused: {current_break_str}")
@@ -1555,7 +1950,7 @@ class EntryManagementDialog(QDialog):
         for row, entry_tuple in enumerate(entries):
             entry_id, duration_seconds, timestamp_str_utc, entry_type = entry_tuple
 
-            formatted_duration = MainWindow.format_time(None, duration_seconds)
+            formatted_duration = MainWindow.format_time(duration_seconds)
             dt_utc = QDateTime.fromString(timestamp_str_utc, "yyyy-MM-dd HH:mm:ss")
             dt_utc.setTimeSpec(Qt.TimeSpec.UTC)
             dt_local = dt_utc.toLocalTime()
@@ -1862,12 +2257,92 @@ class AddEditEntryDialog(QDialog):
             super().accept()
 
 # --- Daily Snapshot Dialog (unchanged) ---
+class NumericTreeItem(QTreeWidgetItem):
+    """Tree item that sorts duration columns by the seconds stored in UserRole, not by display text."""
+    def __lt__(self, other):
+        tree = self.treeWidget()
+        column = tree.sortColumn() if tree else 0
+        if column == 0:
+            return self.text(0).lower() < other.text(0).lower()
+        return (self.data(column, Qt.ItemDataRole.UserRole) or 0) < (other.data(column, Qt.ItemDataRole.UserRole) or 0)
+
+
+class SnapshotEntriesModel(QAbstractTableModel):
+    """
+    Read-only model for the Daily Snapshot entries table (QTableView).
+    Holds prebuilt plain-Python rows; the view only asks for the cells it shows,
+    so loading a day with thousands of entries does not create an item per cell.
+    Row format: (activity_name, duration_str, type_str, time_str, duration_seconds)
+    """
+    HEADERS = ["Activity", "Duration", "Type", "Entry Time"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []
+
+    @staticmethod
+    def build_rows(entries):
+        """Turns DB entries (activity_id, name, duration, type, timestamp_str, session_id) into display rows."""
+        rows = []
+        append_row = rows.append
+        format_time = MainWindow.format_time
+        timegm, localtime = calendar.timegm, time.localtime
+        for _activity_id, activity_name, duration, entry_type, timestamp_str, _session_id in entries:
+            # Время из БД всегда "yyyy-MM-dd HH:MM:SS" (UTC) - режем строку вместо QDateTime.fromString на каждую строку
+            if len(timestamp_str) >= 19 and timestamp_str[13] == ':' and timestamp_str[16] == ':':
+                utc_epoch = timegm((int(timestamp_str[0:4]), int(timestamp_str[5:7]), int(timestamp_str[8:10]),
+                                    int(timestamp_str[11:13]), int(timestamp_str[14:16]), int(timestamp_str[17:19])))
+                # Смещение для каждой записи: в день перехода на летнее/зимнее время оно меняется посреди дня
+                formatted_timestamp_display = format_time((utc_epoch + localtime(utc_epoch).tm_gmtoff) % 86400)
+            else:
+                parts = timestamp_str.split(' '); formatted_timestamp_display = parts[1] if len(parts)>1 else timestamp_str
+            append_row((activity_name, format_time(duration), entry_type.capitalize(), formatted_timestamp_display, duration))
+        return rows
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self._rows = rows
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return QVariant()
+        row = self._rows[index.row()]
+        column = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            return row[column]
+        if role == Qt.ItemDataRole.TextAlignmentRole and column > 0:
+            return Qt.AlignmentFlag.AlignCenter
+        if role == Qt.ItemDataRole.UserRole and column == 1:
+            return row[4] # Длительность в секундах
+        return QVariant()
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return QVariant()
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        sort_index = 4 if column == 1 else column # Длительность сортируем по секундам, а не по строке
+        self.layoutAboutToBeChanged.emit()
+        self._rows.sort(key=lambda row: row[sort_index], reverse=(order == Qt.SortOrder.DescendingOrder))
+        self.layoutChanged.emit()
+
+
 class DailySnapshotDialog(QDialog):
     def __init__(self, db_manager, parent=None):
         super().__init__(parent)
         self.db_manager = db_manager
         self.setWindowTitle("Daily Snapshot")
         self.setMinimumSize(700, 550) # Slightly larger size
+        # LRU-кэш данных по дням: {(date, activity_version, entries_version[, bucket]): (entries, direct_durations)}
+        self._snapshot_cache = OrderedDict()
 
         layout = QVBoxLayout(self)
         date_layout = QHBoxLayout()
@@ -1899,8 +2374,7 @@ class DailySnapshotDialog(QDialog):
         header_summary.setSectionResizeMode(1, QHeaderView.ResizeMode.ResizeToContents) # Work
         header_summary.setSectionResizeMode(2, QHeaderView.ResizeMode.ResizeToContents) # Break  <<< ИСПРАВЛЕНО
         header_summary.setSectionResizeMode(3, QHeaderView.ResizeMode.ResizeToContents) 
-        self.summary_tree.setSortingEnabled(True)
-        self.summary_tree.sortByColumn(3, Qt.SortOrder.DescendingOrder) # Сортировка по общему времени
+        # Сортировка (по общему времени) включается в load_snapshot после построения дерева
         # --- КОНЕЦ ИЗМЕНЕНИЯ ---
         summary_layout.addWidget(self.summary_tree)
         splitter.addWidget(summary_widget)
@@ -1910,17 +2384,21 @@ class DailySnapshotDialog(QDialog):
         details_layout = QVBoxLayout(details_widget)
         details_layout.setContentsMargins(0,0,0,0)
         details_layout.addWidget(QLabel("All Entries for the Day:"))
-        self.entries_table = QTableWidget()
-        # --- ИЗМЕНЕНИЕ: Больше колонок ---
-        self.entries_table.setColumnCount(4)
-        self.entries_table.setHorizontalHeaderLabels(["Activity", "Duration", "Type", "Entry Time"])
+        # QTableView + модель: ячейки не создаются заранее, view запрашивает только видимые
+        self.entries_model = SnapshotEntriesModel(self)
+        self.entries_table = QTableView()
+        self.entries_table.setModel(self.entries_model)
+        self.entries_table.verticalHeader().setVisible(False)
         header_details = self.entries_table.horizontalHeader()
         header_details.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch) # Activity
-        header_details.setSectionResizeMode(1, QHeaderView.ResizeMode.ResizeToContents) # Duration
-        header_details.setSectionResizeMode(2, QHeaderView.ResizeMode.ResizeToContents) # Type
-        header_details.setSectionResizeMode(3, QHeaderView.ResizeMode.ResizeToContents) # Time
+        # Interactive, а не ResizeToContents: ширины подгоняются один раз после загрузки (load_snapshot),
+        # иначе Qt измеряет все ячейки при каждом изменении
+        header_details.setSectionResizeMode(1, QHeaderView.ResizeMode.Interactive) # Duration
+        header_details.setSectionResizeMode(2, QHeaderView.ResizeMode.Interactive) # Type
+        header_details.setSectionResizeMode(3, QHeaderView.ResizeMode.Interactive) # Time
     # --- КОНЕЦ ИЗМЕНЕНИЯ ---
-        self.entries_table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.entries_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.entries_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
         self.entries_table.setSortingEnabled(True)
         details_layout.addWidget(self.entries_table)
         splitter.addWidget(details_widget)
@@ -1946,139 +2424,113 @@ class DailySnapshotDialog(QDialog):
         selected_date = self.date_edit.date().toString("yyyy-MM-dd")
         print(f"Loading snapshot for {selected_date}...")
 
-        # --- ИЗМЕНЕНИЕ: Используем новый метод с типом ---
-        entries = self.db_manager.get_entries_for_date_with_type(selected_date)
-        # Теперь entries содержит: (activity_id, activity_name, duration, entry_type, timestamp_str)
-        # --- КОНЕЦ ИЗМЕНЕНИЯ ---
+        # Повторный показ того же дня без изменений в БД берется из кэша, без запросов.
+        # Для сегодняшнего дня ключ дополнительно привязан к 5-минутному интервалу,
+        # чтобы записи, сделанные не через этот DatabaseManager, появлялись не позже чем через 5 минут
+        cache_key = (selected_date, self.db_manager.activity_version, self.db_manager.entries_version)
+        if self.date_edit.date() == QDate.currentDate():
+            cache_key += (int(time.time() // SNAPSHOT_TODAY_CACHE_BUCKET_SECONDS),)
+        cached = self._snapshot_cache.get(cache_key)
+        if cached is not None:
+            self._snapshot_cache.move_to_end(cache_key)
+            entries, direct_durations = cached
+        else:
+            # entries содержит: (activity_id, activity_name, duration, entry_type, timestamp_str, session_id)
+            entries = self.db_manager.get_entries_for_date_with_type(selected_date)
+            # Агрегация по типам делается в SQL (GROUP BY), а не построчно в Python
+            direct_durations = self.db_manager.get_direct_durations_for_date(selected_date) if entries else {}
+            self._snapshot_cache[cache_key] = (entries, direct_durations)
+            if len(self._snapshot_cache) > SNAPSHOT_CACHE_MAX_DAYS:
+                self._snapshot_cache.popitem(last=False)
 
         # Очистка виджетов
-        self.entries_table.setSortingEnabled(False)
-        self.entries_table.setRowCount(0)
+        self.entries_model.set_rows([])
         self.summary_tree.clear()
         self.summary_tree.setSortingEnabled(False)
 
-        total_duration_day_seconds = 0
-        total_work_day_seconds = 0 # Общее РАБОЧЕЕ время за день
         if not entries:
             # ... (код для случая без записей) ...
             return
 
-        # --- ИЗМЕНЕНИЕ: Словари для агрегации по типам ---
-        work_time_by_activity_id = defaultdict(int)
-        break_time_by_activity_id = defaultdict(int)
-        activity_names = {} # Сохраним имена активностей {id: name}
-        # --- КОНЕЦ ИЗМЕНЕНИЯ ---
-
-        self.entries_table.setRowCount(len(entries))
-        # --- ИЗМЕНЕНИЕ: Обработка entry_type ---
-# <<< ИСПРАВЛЕНИЕ: Добавлена переменная _session_id для распаковки 6-го элемента >>>
-        for row, (activity_id, activity_name, duration, entry_type, timestamp_str, _session_id) in enumerate(entries):
-            total_duration_day_seconds += duration # Общее время (включая перерывы)
-            activity_names[activity_id] = activity_name # Сохраняем имя
-
-            # Агрегация по типам
-            if entry_type == 'work':
-                work_time_by_activity_id[activity_id] += duration
-                total_work_day_seconds += duration # Считаем общее рабочее время
-            elif entry_type == 'break':
-                break_time_by_activity_id[activity_id] += duration
-
-            # --- Заполнение таблицы детальных записей (Добавляем Type) ---
-            formatted_duration = MainWindow.format_time(None, duration)
-            formatted_timestamp_display = timestamp_str # Default
-            try:
-                dt_utc = QDateTime.fromString(timestamp_str, "yyyy-MM-dd HH:mm:ss")
-                dt_utc.setTimeSpec(Qt.TimeSpec.UTC)
-                dt_local = dt_utc.toLocalTime()
-                formatted_timestamp_display = dt_local.toString("HH:mm:ss")
-            except Exception as e:
-                parts = timestamp_str.split(' '); formatted_timestamp_display = parts[1] if len(parts)>1 else timestamp_str
-
-            name_item = QTableWidgetItem(activity_name)
-            duration_item = QTableWidgetItem(formatted_duration)
-            type_item = QTableWidgetItem(entry_type.capitalize()) # Отображаем тип
-            time_item = QTableWidgetItem(formatted_timestamp_display)
+        work_time_by_activity_id = {aid: work for aid, (work, _brk) in direct_durations.items()}
+        break_time_by_activity_id = {aid: brk for aid, (_work, brk) in direct_durations.items()}
+        total_work_day_seconds = sum(work_time_by_activity_id.values()) # Общее РАБОЧЕЕ время за день
 
-            duration_item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-            type_item.setTextAlignment(Qt.AlignmentFlag.AlignCenter) # Выравниваем тип
-            time_item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-            duration_item.setData(Qt.ItemDataRole.UserRole, duration)
-
-            self.entries_table.setItem(row, 0, name_item)
-            self.entries_table.setItem(row, 1, duration_item)
-            self.entries_table.setItem(row, 2, type_item) # Новая колонка
-            self.entries_table.setItem(row, 3, time_item) # Старая колонка времени теперь 3я
-        # --- КОНЕЦ ИЗМЕНЕНИЯ в цикле ---
-
-        self.entries_table.setSortingEnabled(True)
+        # Строки таблицы - простые кортежи; модель сбрасывается один раз
+        self.entries_model.set_rows(SnapshotEntriesModel.build_rows(entries))
         self.entries_table.sortByColumn(3, Qt.SortOrder.AscendingOrder) # Сортируем по времени записи
+        for column in (1, 2, 3):
+            self.entries_table.resizeColumnToContents(column)
 
         # --- ИЗМЕНЕНИЕ: Построение дерева с новыми данными ---
         activity_hierarchy = self.db_manager.get_activity_hierarchy()
-        aggregated_work_time = defaultdict(int)
-        aggregated_break_time = defaultdict(int)
-
-        # Функция агрегации времени (включая дочерние) - теперь считает оба типа
-        def aggregate_time_recursive(node):
-            activity_id = node['id']
-            node_work_time = work_time_by_activity_id.get(activity_id, 0)
-            node_break_time = break_time_by_activity_id.get(activity_id, 0)
-
-            for child_node in node['children']:
-                child_work, child_break = aggregate_time_recursive(child_node)
-                node_work_time += child_work
-                node_break_time += child_break
-
-            aggregated_work_time[activity_id] = node_work_time
-            aggregated_break_time[activity_id] = node_break_time
-            return node_work_time, node_break_time
-
-        for top_level_node in activity_hierarchy:
-            aggregate_time_recursive(top_level_node)
-
-        # Функция построения дерева
-        def build_summary_tree(parent_item, nodes):
-            for node_data in nodes:
-                activity_id = node_data['id']
-                activity_name = node_data['name'] # Имя из иерархии
-                work_seconds = aggregated_work_time.get(activity_id, 0)
-                break_seconds = aggregated_break_time.get(activity_id, 0)
-                total_seconds = work_seconds + break_seconds
-
-                # Добавляем только если было какое-то время
-                if total_seconds > 0:
-                    fmt_work = MainWindow.format_time(None, work_seconds)
-                    fmt_break = MainWindow.format_time(None, break_seconds)
-                    fmt_total = MainWindow.format_time(None, total_seconds)
-
-                    tree_item = QTreeWidgetItem(parent_item)
-                    tree_item.setText(0, activity_name) # Activity
-                    tree_item.setText(1, fmt_work)    # Work Time
-                    tree_item.setText(2, fmt_break)   # Break Time
-                    tree_item.setText(3, fmt_total)   # Total Time
-
-                    # Выравнивание
-                    tree_item.setTextAlignment(1, Qt.AlignmentFlag.AlignCenter)
-                    tree_item.setTextAlignment(2, Qt.AlignmentFlag.AlignCenter)
-                    tree_item.setTextAlignment(3, Qt.AlignmentFlag.AlignCenter)
-
-                    # Данные для сортировки (используем общее время для главной сортировки)
-                    tree_item.setData(1, Qt.ItemDataRole.UserRole, work_seconds)
-                    tree_item.setData(2, Qt.ItemDataRole.UserRole, break_seconds)
-                    tree_item.setData(3, Qt.ItemDataRole.UserRole, total_seconds)
-                    tree_item.setData(0, Qt.ItemDataRole.UserRole, activity_id)
-
-                    if node_data['children']:
-                        build_summary_tree(tree_item, node_data['children'])
-
-        build_summary_tree(self.summary_tree.invisibleRootItem(), activity_hierarchy)
-        self.summary_tree.expandAll()
+
+        # Один итеративный post-order обход: агрегируем время (включая дочерние) и сразу,
+        # на обратном пути, строим элемент дерева. Элементы создаются без родителя,
+        # дочерние добавляются пачкой (addChildren).
+        node_results = {} # {activity_id: (work_seconds, break_seconds, tree_item или None)}
+        summary_item_count = 0
+        stack = [(node, False) for node in activity_hierarchy]
+        while stack:
+            node_data, children_done = stack.pop()
+            if not children_done:
+                stack.append((node_data, True))
+                stack.extend((child_node, False) for child_node in node_data['children'])
+                continue
+
+            activity_id = node_data['id']
+            work_seconds = work_time_by_activity_id.get(activity_id, 0)
+            break_seconds = break_time_by_activity_id.get(activity_id, 0)
+            child_items = []
+            for child_node in node_data['children']:
+                child_work, child_break, child_item = node_results.pop(child_node['id'])
+                work_seconds += child_work
+                break_seconds += child_break
+                if child_item is not None:
+                    child_items.append(child_item)
+            total_seconds = work_seconds + break_seconds
+
+            # Добавляем только если было какое-то время
+            tree_item = None
+            if total_seconds > 0:
+                tree_item = NumericTreeItem()
+                summary_item_count += 1
+                tree_item.setText(0, node_data['name']) # Activity (имя из иерархии)
+                tree_item.setText(1, MainWindow.format_time(work_seconds))    # Work Time
+                tree_item.setText(2, MainWindow.format_time(break_seconds))   # Break Time
+                tree_item.setText(3, MainWindow.format_time(total_seconds))   # Total Time
+
+                # Выравнивание
+                tree_item.setTextAlignment(1, Qt.AlignmentFlag.AlignCenter)
+                tree_item.setTextAlignment(2, Qt.AlignmentFlag.AlignCenter)
+                tree_item.setTextAlignment(3, Qt.AlignmentFlag.AlignCenter)
+
+                # Данные для сортировки (используем общее время для главной сортировки)
+                tree_item.setData(1, Qt.ItemDataRole.UserRole, work_seconds)
+                tree_item.setData(2, Qt.ItemDataRole.UserRole, break_seconds)
+                tree_item.setData(3, Qt.ItemDataRole.UserRole, total_seconds)
+                tree_item.setData(0, Qt.ItemDataRole.UserRole, activity_id)
+                if child_items:
+                    tree_item.addChildren(child_items)
+            node_results[activity_id] = (work_seconds, break_seconds, tree_item)
+
+        top_level_items = [node_results[node['id']][2] for node in activity_hierarchy
+                           if node_results[node['id']][2] is not None]
+
+        self.summary_tree.setUpdatesEnabled(False)
+        self.summary_tree.addTopLevelItems(top_level_items)
         self.summary_tree.setSortingEnabled(True)
         self.summary_tree.sortByColumn(3, Qt.SortOrder.DescendingOrder) # Сортируем по Total Time
+        # Раскрываем один раз, после построения и сортировки; большие деревья - только верхние уровни
+        if summary_item_count > SUMMARY_TREE_FULL_EXPAND_LIMIT:
+            self.summary_tree.expandToDepth(1)
+        else:
+            self.summary_tree.expandAll()
+        self.summary_tree.setUpdatesEnabled(True)
         # --- КОНЕЦ ИЗМЕНЕНИЯ в построении дерева ---
 
         # Обновляем итоговую метку (показываем ОБЩЕЕ рабочее время)
-        formatted_total_work_day = MainWindow.format_time(None, total_work_day_seconds)
+        formatted_total_work_day = MainWindow.format_time(total_work_day_seconds)
         self.summary_label.setText(f"Total WORK time for the day: {formatted_total_work_day}")
         print(f"Snapshot for {selected_date} loaded. Entries: {len(entries)}. Total work time: {formatted_total_work_day}")# --- NEW: Configure Habit Dialog ---
 
@@ -2622,22 +3074,20 @@ class PostSessionReviewDialog(QDialog):
                 super().accept()
                 return
 
-        num_saved_successfully = 0
-        for entry_data in entries_to_save_from_dialog:
-            success = self.db_manager.add_time_entry(
-                activity_id=self.activity_id,
-                duration_seconds=entry_data['duration_seconds'],
-                entry_type=entry_data['type'],
-                session_id=self.session_id
-            )
-            if success:
+        # Все отмеченные интервалы сохраняются одной транзакцией
+        rows_to_save = [(self.activity_id, entry_data['duration_seconds'], None, entry_data['type'], self.session_id)
+                        for entry_data in entries_to_save_from_dialog]
+        saved_row_ids = {id(row) for row in self.db_manager.add_time_entries(rows_to_save)}
+        num_saved_successfully = len(saved_row_ids)
+        # В сигнал попадают только реально записанные интервалы; о каждом несохраненном - предупреждение
+        for entry_data, row in zip(entries_to_save_from_dialog, rows_to_save):
+            if id(row) in saved_row_ids:
                 saved_entries_details.append(entry_data)
-                num_saved_successfully +=1
             else:
                 QMessageBox.warning(self, "Database Error",
                                     f"Failed to save a '{entry_data['type']}' interval of "
                                     f"{entry_data['duration_seconds']}s to the database.")
-        
+
         print(f"PostSessionReviewDialog: Saved {num_saved_successfully} of {len(entries_to_save_from_dialog)} marked entries.")
         self.session_reviewed_and_saved.emit(self.activity_id, self.activity_name, self.session_id, saved_entries_details)
         super().accept()
@@ -2815,7 +3265,7 @@ class HabitTableModel(QAbstractTableModel):
         self.db_manager = db_manager
         # Now expects tuples of 5: (id, name, type, unit, goal)
         self._habit_configs = []
-        self._habit_logs_cache = {} # Cache: (activity_id, 'YYYY-MM-DD') -> value
+        self._habit_log_rows = {} # Cache: activity_id -> array('d') per day of month (index = col), NaN = not logged
         self._row_map = {}        # Cache: row_index -> activity_id
         self._col_map = {}        # Cache: col_index -> 'YYYY-MM-DD' date string
         self._current_year = -1
@@ -2828,7 +3278,7 @@ class HabitTableModel(QAbstractTableModel):
    
     def load_data(self, year, month):
         """Loads/reloads habit and log data for the given year and month."""
-        print(f"Model: Loading data for {year}-{month:02d}")
+        log.debug("Model: Loading data for %s-%02d", year, month)
         self.beginResetModel()  # Important: Signal start of major change
 
         self._current_year = year
@@ -2854,7 +3304,7 @@ class HabitTableModel(QAbstractTableModel):
         }
 
         # 4. Fetch logs for the month
-        self._habit_logs_cache = self.db_manager.get_habit_logs_for_month(year, month)
+        self._habit_log_rows = self.db_manager.get_habit_log_rows_for_month(year, month)
         # --- Расчет среднего выполнения для дней месяца ---
         self._daily_avg_completion = {}
         today = QDate.currentDate()
@@ -2865,7 +3315,6 @@ class HabitTableModel(QAbstractTableModel):
 
         while temp_date <= month_end:
              if temp_date <= today: # Считаем только для прошедших/текущего дня
-                 date_str = temp_date.toString("yyyy-MM-dd")
                  total_progress = 0.0
                  habits_with_goals_count = 0
                  # Используем self._habit_configs, который уже загружен
@@ -2876,7 +3325,7 @@ class HabitTableModel(QAbstractTableModel):
                       h_goal = config[4]
 
                       if h_type == HABIT_TYPE_NUMERIC and h_goal is not None and h_goal > 0:
-                          value = self._habit_logs_cache.get((h_id, date_str)) # Ищем лог по ID
+                          value = self._log_value(h_id, temp_date.day() - 1) # Ищем лог по ID
                           habits_with_goals_count += 1
                           if value is not None:
                               total_progress += min(value / h_goal, 1.0)
@@ -2887,7 +3336,14 @@ class HabitTableModel(QAbstractTableModel):
              temp_date = temp_date.addDays(1)
              
         self.endResetModel()
-        print(f"Model: Loaded {len(self._habit_configs)} habits. Precalculated {len(self._daily_avg_completion)} daily averages > 70%.")
+        log.debug("Model: Loaded %s habits. Precalculated %s daily averages > 70%%.", len(self._habit_configs), len(self._daily_avg_completion))
+    def _log_value(self, activity_id, col):
+        """Logged value of a habit for the day at column col (None if not logged)."""
+        day_values = self._habit_log_rows.get(activity_id)
+        if day_values is None: return None
+        value = day_values[col]
+        return None if math.isnan(value) else value
+
     # --- Required Model Methods ---
 
     def rowCount(self, parent=QModelIndex()):
@@ -2908,16 +3364,16 @@ class HabitTableModel(QAbstractTableModel):
             activity_id = self._row_map.get(row)
             date_str = self._col_map.get(col)
             if activity_id is None or date_str is None:
-                 print(f"Warning: Invalid row/col map lookup for {row},{col}")
+                 log.warning("Invalid row/col map lookup for %s,%s", row, col)
                  return QVariant()
 
             config = self._habit_configs[row]
             if config[0] != activity_id: # Sanity check
-                 print(f"Warning: Row map/config list mismatch at row {row}")
+                 log.warning("Row map/config list mismatch at row %s", row)
                  config = next((c for c in self._habit_configs if c[0] == activity_id), None)
 
             if not config:
-                 print(f"Warning: Config not found for activity_id {activity_id}")
+                 log.warning("Config not found for activity_id %s", activity_id)
                  return QVariant()
 
             habit_type = config[2]
@@ -2926,7 +3382,7 @@ class HabitTableModel(QAbstractTableModel):
 
             # --- Handle Roles ---
             if role == HABIT_VALUE_ROLE:
-                return self._habit_logs_cache.get((activity_id, date_str), None)
+                return self._log_value(activity_id, col)
             elif role == HABIT_TYPE_ROLE:
                 return habit_type
             elif role == HABIT_UNIT_ROLE:
@@ -2943,7 +3399,7 @@ class HabitTableModel(QAbstractTableModel):
                     return QColor(60, 60, 60)
                 return QVariant()
             elif role == Qt.ItemDataRole.ToolTipRole:
-                 value = self._habit_logs_cache.get((activity_id, date_str))
+                 value = self._log_value(activity_id, col)
                  name = config[1]
                  tt = f"{name}\n{date_str}"
                  # <<< Updated Tooltip for Goal >>>
@@ -2961,9 +3417,7 @@ class HabitTableModel(QAbstractTableModel):
                  return "" # Let delegate handle visuals
 
         except Exception as e:
-             print(f"Error in model data({row},{col}), role {role}: {e}")
-             import traceback
-             traceback.print_exc()
+             log.exception("Error in model data(%s,%s), role %s: %s", row, col, role, e)
              return QVariant()
 
         return QVariant()
@@ -2977,16 +3431,17 @@ class HabitTableModel(QAbstractTableModel):
         date_str = self._col_map.get(col)
         if activity_id is None or date_str is None: return False
 
-        print(f"Model: setData triggered for A_ID={activity_id}, Date={date_str}, NewValue={value}")
+        log.debug("Model: setData triggered for A_ID=%s, Date=%s, NewValue=%s", activity_id, date_str, value)
         if self.db_manager.log_habit(activity_id, date_str, value):
-            cache_key = (activity_id, date_str)
-            if value is None: self._habit_logs_cache.pop(cache_key, None)
-            else: self._habit_logs_cache[cache_key] = value
+            day_values = self._habit_log_rows.get(activity_id)
+            if day_values is None:
+                day_values = self._habit_log_rows[activity_id] = array('d', [math.nan]) * self._days_in_month
+            day_values[col] = math.nan if value is None else value
             self.dataChanged.emit(index, index, [role, Qt.ItemDataRole.ToolTipRole, Qt.ItemDataRole.DisplayRole])
-            print(f"Model: setData successful for {activity_id} on {date_str}")
+            log.debug("Model: setData successful for %s on %s", activity_id, date_str)
             return True
         else:
-            print(f"Model: setData FAILED DB update for {activity_id} on {date_str}")
+            log.error("Model: setData FAILED DB update for %s on %s", activity_id, date_str)
             return False
 
     def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
@@ -3090,27 +3545,27 @@ class HabitTableModel(QAbstractTableModel):
          if not (0 <= source_row < self.rowCount()) or \
             not (0 <= destination_row < self.rowCount()) or \
             source_row == destination_row: return False
-         print(f"Model: Attempting move from {source_row} to {destination_row}")
+         log.debug("Model: Attempting move from %s to %s", source_row, destination_row)
          actual_dest_signal_row = destination_row if destination_row < source_row else destination_row + 1
          if not self.beginMoveRows(QModelIndex(), source_row, source_row, QModelIndex(), actual_dest_signal_row):
-              print("Model: beginMoveRows failed.")
+              log.warning("Model: beginMoveRows failed.")
               return False
          moved_item = self._habit_configs.pop(source_row)
          self._habit_configs.insert(destination_row, moved_item)
          ordered_ids = self._get_ordered_habit_ids()
          db_success = self.db_manager.update_habit_order(ordered_ids)
          if db_success:
-             print("Model: DB order updated successfully.")
+             log.debug("Model: DB order updated successfully.")
              self._row_map = {idx: config[0] for idx, config in enumerate(self._habit_configs)}
              self.endMoveRows()
-             print(f"Model: Move from {source_row} to {destination_row} completed.")
+             log.debug("Model: Move from %s to %s completed.", source_row, destination_row)
              return True
          else:
-             print("Model: DB order update FAILED. Rolling back internal move.")
+             log.error("Model: DB order update FAILED. Rolling back internal move.")
              rollback_item = self._habit_configs.pop(destination_row)
              self._habit_configs.insert(source_row, rollback_item)
              self.endMoveRows()
-             print(f"Model: Move from {source_row} to {destination_row} failed & rolled back.")
+             log.warning("Model: Move from %s to %s failed & rolled back.", source_row, destination_row)
              return False
 # --- End of HabitTableModel ---
 
@@ -3454,6 +3909,194 @@ class HabitTrackerDialog(QDialog):
                   QMessageBox.warning(self, "Error", "Failed to move habit down. Database update may have failed.")
              # View updates automatically via model signals if successful
 
+class ActivityNode:
+    """One activity in ActivityTreeModel; also used as the QModelIndex internal pointer."""
+    __slots__ = ('id', 'name', 'habit_type', 'parent', 'children')
+
+    def __init__(self, activity_id, name, habit_type, parent):
+        self.id = activity_id
+        self.name = name
+        self.habit_type = habit_type
+        self.parent = parent # ActivityNode or None for top-level
+        self.children = []
+
+    @property
+    def display_text(self):
+        is_habit = self.habit_type is not None and self.habit_type != HABIT_TYPE_NONE
+        return "[H] " + self.name if is_habit else self.name
+
+
+class ActivityTreeModel(QAbstractItemModel):
+    """
+    Model for the main activity tree (QTreeView).
+    Built once from DatabaseManager.get_activity_hierarchy() into an {id: ActivityNode} map;
+    the view only asks for the rows it paints, and single add/rename/delete/habit changes
+    are applied in place with begin/end row notifications instead of a reload.
+    Siblings are kept sorted by their display text.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._roots = []
+        self._nodes = {} # {activity_id: ActivityNode}
+        self._active_ids = set() # Activities with a running timer (shown in bold)
+        self.bold_font = None
+
+    def load(self, hierarchy):
+        """Rebuilds the model from a (cached, read-only) activity hierarchy."""
+        self.beginResetModel()
+        self._roots = []
+        self._nodes = {}
+        stack = [(node, None) for node in hierarchy]
+        while stack:
+            data, parent = stack.pop()
+            node = ActivityNode(data['id'], data['name'], data.get('habit_type'), parent)
+            self._nodes[node.id] = node
+            (parent.children if parent else self._roots).append(node)
+            stack.extend((child, node) for child in data['children'])
+        for siblings in [self._roots] + [node.children for node in self._nodes.values()]:
+            siblings.sort(key=lambda node: node.display_text)
+        self._active_ids &= self._nodes.keys()
+        self.endResetModel()
+
+    # --- Lookups ---
+    def _siblings(self, node):
+        return node.parent.children if node.parent else self._roots
+
+    def _index_for_node(self, node):
+        return self.createIndex(self._siblings(node).index(node), 0, node)
+
+    def index_for_id(self, activity_id):
+        """QModelIndex of an activity (invalid if it is not in the tree)."""
+        node = self._nodes.get(activity_id)
+        return self._index_for_node(node) if node else QModelIndex()
+
+    def activity_id(self, index):
+        return index.internalPointer().id if index.isValid() else None
+
+    def activity_name(self, index):
+        """Activity name without the "[H] " habit prefix."""
+        return index.internalPointer().name if index.isValid() else None
+
+    # --- QAbstractItemModel interface ---
+    def index(self, row, column, parent=QModelIndex()):
+        siblings = parent.internalPointer().children if parent.isValid() else self._roots
+        if column != 0 or not 0 <= row < len(siblings):
+            return QModelIndex()
+        return self.createIndex(row, 0, siblings[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        parent_node = index.internalPointer().parent
+        return self._index_for_node(parent_node) if parent_node else QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return len(parent.internalPointer().children) if parent.isValid() else len(self._roots)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return QVariant()
+        node = index.internalPointer()
+        if role == Qt.ItemDataRole.DisplayRole:
+            return node.display_text
+        if role == Qt.ItemDataRole.UserRole:
+            return node.id
+        if role == Qt.ItemDataRole.FontRole and node.id in self._active_ids:
+            return self.bold_font
+        return QVariant()
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+
+    # --- In-place updates ---
+    @staticmethod
+    def _sorted_row(siblings, node):
+        """Row at which node keeps siblings (not containing node) sorted."""
+        keys = [sibling.display_text for sibling in siblings]
+        return bisect_right(keys, node.display_text)
+
+    def add_activity(self, activity_id, name, parent_id):
+        """Inserts a new childless activity; returns its index (invalid if the parent is unknown)."""
+        parent = None
+        if parent_id is not None:
+            parent = self._nodes.get(parent_id)
+            if parent is None:
+                return QModelIndex()
+        node = ActivityNode(activity_id, name, None, parent)
+        siblings = self._siblings(node)
+        row = self._sorted_row(siblings, node)
+        parent_index = self._index_for_node(parent) if parent else QModelIndex()
+        self.beginInsertRows(parent_index, row, row)
+        siblings.insert(row, node)
+        self._nodes[activity_id] = node
+        self.endInsertRows()
+        return self.createIndex(row, 0, node)
+
+    def remove_activity(self, activity_id):
+        """Removes an activity together with its whole branch."""
+        node = self._nodes.get(activity_id)
+        if node is None:
+            return
+        siblings = self._siblings(node)
+        row = siblings.index(node)
+        parent_index = self._index_for_node(node.parent) if node.parent else QModelIndex()
+        self.beginRemoveRows(parent_index, row, row)
+        del siblings[row]
+        stack = [node]
+        while stack:
+            removed = stack.pop()
+            self._nodes.pop(removed.id, None)
+            self._active_ids.discard(removed.id)
+            stack.extend(removed.children)
+        self.endRemoveRows()
+
+    def _update_display(self, node):
+        """Moves node to its sorted position after its display text changed, then repaints it."""
+        siblings = self._siblings(node)
+        old_row = siblings.index(node)
+        del siblings[old_row]
+        new_row = self._sorted_row(siblings, node)
+        siblings.insert(old_row, node)
+        if new_row != old_row:
+            parent_index = self._index_for_node(node.parent) if node.parent else QModelIndex()
+            # destinationChild is counted in the list before the move
+            destination = new_row if new_row < old_row else new_row + 1
+            self.beginMoveRows(parent_index, old_row, old_row, parent_index, destination)
+            del siblings[old_row]
+            siblings.insert(new_row, node)
+            self.endMoveRows()
+        index = self._index_for_node(node)
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole])
+
+    def rename_activity(self, activity_id, name):
+        node = self._nodes.get(activity_id)
+        if node is not None:
+            node.name = name
+            self._update_display(node)
+
+    def set_habit_type(self, activity_id, habit_type):
+        node = self._nodes.get(activity_id)
+        if node is not None:
+            node.habit_type = habit_type
+            self._update_display(node)
+
+    def set_active(self, activity_id, active):
+        """Marks an activity as having a running timer (bold) or not."""
+        if activity_id not in self._nodes or (activity_id in self._active_ids) == active:
+            return
+        if active: self._active_ids.add(activity_id)
+        else: self._active_ids.discard(activity_id)
+        index = self._index_for_node(self._nodes[activity_id])
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.FontRole])
+
+
 class MainWindow(QMainWindow):
     habits_updated = pyqtSignal()
 
@@ -3466,6 +4109,12 @@ class MainWindow(QMainWindow):
         self.db_manager = DatabaseManager()
         self.qtimer = QTimer(self) 
         self.qtimer.timeout.connect(self.update_timer)
+        # Holding an arrow key changes the selection on every key repeat; the DB-backed
+        # status/button refresh runs once the selection has been stable for a moment
+        self._selection_debounce = QTimer(self)
+        self._selection_debounce.setSingleShot(True)
+        self._selection_debounce.setInterval(SELECTION_UI_DEBOUNCE_MS)
+        self._selection_debounce.timeout.connect(self.update_ui_for_selection)
 
         self.selected_activity_details = [] 
         self.active_timer_windows = {}   
@@ -3477,6 +4126,7 @@ class MainWindow(QMainWindow):
         ]
         # Initialize UI element attributes to None before init_ui
         self.activity_tree = None
+        self._activity_model = None
         self.manage_entries_button = None
         self.snapshot_button = None
         self.habit_tracker_button = None
@@ -3487,6 +4137,23 @@ class MainWindow(QMainWindow):
         self.current_global_streak_label = None # Add new labels here
         self.max_global_streak_label = None   # Add new labels here
         self.habit_tracker_dialog_instance = None 
+
+        # Context menu icons: resolved through QStyle once instead of on every right-click
+        style = QApplication.style()
+        self._icon_add = style.standardIcon(QStyle.StandardPixmap.SP_FileDialogNewFolder)
+        self._icon_rename = style.standardIcon(QStyle.StandardPixmap.SP_FileDialogDetailedView)
+        self._icon_configure_habit = QIcon.fromTheme("preferences-system", style.standardIcon(QStyle.StandardPixmap.SP_FileDialogContentsView))
+        self._icon_delete = style.standardIcon(QStyle.StandardPixmap.SP_TrashIcon)
+        self._context_menu_activity_id = None # ID of the item the context menu was opened on
+        self._build_activity_context_menu()
+
+        # Primary screen geometry for timer window placement; re-queried only when screens change
+        self._screen_geom = None
+        app = QApplication.instance()
+        app.primaryScreenChanged.connect(self._on_primary_screen_changed)
+        app.screenAdded.connect(self._refresh_screen_geometry)
+        app.screenRemoved.connect(self._refresh_screen_geometry)
+        self._on_primary_screen_changed(QApplication.primaryScreen())
         
         self.init_ui()
         self.apply_dark_theme()
@@ -3513,17 +4180,22 @@ class MainWindow(QMainWindow):
 
         # --- Activity Tree ---
         main_layout.addWidget(QLabel("Activities (Right-click; Ctrl/Shift to multi-select):"))
-        self.activity_tree = QTreeWidget()
-        self.activity_tree.setMouseTracking(True) # Важно для itemEntered
-        self.activity_tree.itemEntered.connect(self.handle_item_entered)
+        self.activity_tree = QTreeView()
+        self._activity_model = ActivityTreeModel(self)
+        self.activity_tree.setModel(self._activity_model)
+        bold_font = QFont(self.activity_tree.font())
+        bold_font.setBold(True)
+        self._activity_model.bold_font = bold_font
+        self.activity_tree.setMouseTracking(True) # Важно для entered
+        self.activity_tree.entered.connect(self.handle_item_entered)
         # Устанавливаем фильтр событий на область просмотра дерева для отслеживания ухода мыши
         self.activity_tree.viewport().installEventFilter(self)
         self.activity_tree.viewport().setMouseTracking(True) # Также нужно для viewport
         self._hovered_item_id = None # Храним ID элемента под курсором
-        self.activity_tree.setColumnCount(1)
         self.activity_tree.setHeaderHidden(True)
+        self.activity_tree.setUniformRowHeights(True) # Text-only rows: Qt can skip per-row height measurement
         self.activity_tree.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
-        self.activity_tree.itemSelectionChanged.connect(self.handle_selection_change)
+        self.activity_tree.selectionModel().selectionChanged.connect(self.handle_selection_change)
         self.activity_tree.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.activity_tree.customContextMenuRequested.connect(self.show_activity_context_menu)
         self.activity_tree.setDragDropMode(QAbstractItemView.DragDropMode.NoDragDrop)
@@ -3590,37 +4262,26 @@ class MainWindow(QMainWindow):
         
         self.setCentralWidget(central_widget) # Ensure this is at the end if main_layout is for central_widget
 
-    def apply_dark_theme(self):
-        # (Your existing dark theme code remains here)
+    @classmethod
+    @lru_cache(maxsize=None)
+    def _dark_palette(cls):
+        """Builds the dark palette once; every later MainWindow reuses the same QPalette."""
         dark_palette = QPalette()
         dark_palette.setColor(QPalette.ColorRole.Window, QColor(53, 53, 53))
         # ... (rest of your palette settings) ...
         dark_palette.setColor(QPalette.ColorGroup.Disabled, QPalette.ColorRole.Base, QColor(45, 45, 45))
+        return dark_palette
+
+    def apply_dark_theme(self):
         app = QApplication.instance()
         if app:
-            app.setPalette(dark_palette)
+            app.setPalette(self._dark_palette())
             # app.setStyleSheet(...) # Your stylesheet if any
 
     def load_activities(self):
-        """Loads/reloads the activity hierarchy."""
-        self.activity_tree.clear()
-        self.activity_tree.setSortingEnabled(False)
-        hierarchy = self.db_manager.get_activity_hierarchy()
-
-        def add_items_recursive(parent_widget_item, activity_nodes):
-             for node in activity_nodes:
-                 item = QTreeWidgetItem(parent_widget_item)
-                 prefix = "[H] " if node.get('habit_type') is not None and node.get('habit_type') != HABIT_TYPE_NONE else ""
-                 item.setText(0, prefix + node['name'])
-                 item.setData(0, Qt.ItemDataRole.UserRole, node['id'])
-                 if node.get('children'):
-                     add_items_recursive(item, node['children'])
-
-        add_items_recursive(self.activity_tree.invisibleRootItem(), hierarchy)
-
-        self.activity_tree.expandAll()
-        self.activity_tree.setSortingEnabled(True)
-        self.activity_tree.sortByColumn(0, Qt.SortOrder.AscendingOrder)
+        """Loads/reloads the activity hierarchy. Full reload: used on startup;
+        single add/rename/delete/habit changes update the model in place."""
+        self._activity_model.load(self.db_manager.get_activity_hierarchy())
 
         # Reset selection and update UI
         self.activity_tree.clearSelection()
@@ -3646,48 +4307,35 @@ class MainWindow(QMainWindow):
             if self.max_global_streak_label:
                 self.max_global_streak_label.setText("Max Daily Streak: Error")
 
-    def _find_tree_item_by_id(self, activity_id):
-        """Helper to find a tree item by its stored activity ID."""
-        if activity_id is None: return None
-        iterator = QTreeWidgetItemIterator(self.activity_tree)
-        while iterator.value():
-            item = iterator.value()
-            if item.data(0, Qt.ItemDataRole.UserRole) == activity_id:
-                return item
-            iterator += 1
-        return None
-
     def _get_next_multitask_color(self):
         """Cycles through the defined colors for new timer windows."""
         color = self.multitask_colors[self._multitask_color_index % len(self.multitask_colors)]
         self._multitask_color_index += 1
         return color
 
-    def handle_item_entered(self, item: QTreeWidgetItem, column: int):
+    def handle_item_entered(self, index: QModelIndex):
         """Called when the mouse cursor enters an item's area in the tree."""
-        if item:
-            activity_id = item.data(0, Qt.ItemDataRole.UserRole)
-            activity_name_display = item.text(0) # Может содержать "[H] "
-            # Убираем префикс "[H] " для более чистого отображения имени в статусе
-            actual_name = activity_name_display.replace("[H] ", "", 1) if activity_name_display.startswith("[H] ") else activity_name_display
+        if index.isValid():
+            activity_id = self._activity_model.activity_id(index)
+            actual_name = self._activity_model.activity_name(index) # Без префикса "[H] "
             
             if activity_id != getattr(self, '_current_hovered_activity_id_for_status', None): # Проверка для избежания лишних обновлений
                 self._current_hovered_activity_id_for_status = activity_id
                 self._update_main_status_label(activity_id=activity_id, activity_name=actual_name)
-        # Если item is None, обработка ухода мыши происходит в eventFilter
+        # Если index невалиден, обработка ухода мыши происходит в eventFilter
 
-    def update_status_for_hovered_item(self, item):
+    def update_status_for_hovered_item(self, index):
         """Обновляет status_label для элемента под курсором или сбрасывает его."""
         if self.active_timer_windows:
             return
 
-        activity_id = item.data(0, Qt.ItemDataRole.UserRole) if item else None
+        activity_id = self._activity_model.activity_id(index) if index is not None else None
 
         if activity_id == self._hovered_item_id:
             return
         self._hovered_item_id = activity_id
 
-        if item and activity_id is not None:
+        if activity_id is not None:
             avg_work, avg_break, avg_total = self.db_manager.calculate_average_session_times(activity_id)
 
             # CORRECTED CALLS:
@@ -3703,17 +4351,15 @@ class MainWindow(QMainWindow):
     def eventFilter(self, source, event: QEvent):
         if source is self.activity_tree.viewport() and event.type() == QEvent.Type.Leave:
             self._current_hovered_activity_id_for_status = None # Сбрасываем ID при уходе мыши
-            selected_items = self.activity_tree.selectedItems()
-            if len(selected_items) == 1:
+            selected_rows = self.activity_tree.selectionModel().selectedRows()
+            if len(selected_rows) == 1:
                 # Если что-то выбрано (один элемент), показать его статус
-                item = selected_items[0]
-                activity_id = item.data(0, Qt.ItemDataRole.UserRole)
-                activity_name_display = item.text(0)
-                actual_name = activity_name_display.replace("[H] ", "", 1) if activity_name_display.startswith("[H] ") else activity_name_display
-                self._update_main_status_label(activity_id=activity_id, activity_name=actual_name)
-            elif len(selected_items) > 1:
+                index = selected_rows[0]
+                self._update_main_status_label(activity_id=self._activity_model.activity_id(index),
+                                               activity_name=self._activity_model.activity_name(index))
+            elif len(selected_rows) > 1:
                 # Если выбрано несколько, показать количество
-                self._update_main_status_label(force_text=f"{len(selected_items)} activities selected.")
+                self._update_main_status_label(force_text=f"{len(selected_rows)} activities selected.")
             else:
                 # Если ничего не выбрано, показать текст по умолчанию
                 self._update_main_status_label() 
@@ -3721,25 +4367,28 @@ class MainWindow(QMainWindow):
         return super().eventFilter(source, event)
 
     def handle_selection_change(self):
-        """Updates the internal list of selected activities and the UI."""
+        """Updates the internal list of selected activities and schedules a UI refresh."""
         # <<< MODIFICATION: No longer blocked by active timers >>>
-        selected_items = self.activity_tree.selectedItems()
-        self.selected_activity_details = []
-        for item in selected_items:
-            item_id = item.data(0, Qt.ItemDataRole.UserRole)
-            if item_id is not None:
-                display_name = item.text(0)
-                actual_name = display_name.replace("[H] ", "", 1) if display_name.startswith("[H] ") else display_name
-                self.selected_activity_details.append((item_id, actual_name))
-        self.update_ui_for_selection()
+        # The list itself is updated right away (cheap, and start/manage actions read it);
+        # only update_ui_for_selection, which queries the DB, is debounced
+        model = self._activity_model
+        self.selected_activity_details = [
+            (model.activity_id(index), model.activity_name(index))
+            for index in self.activity_tree.selectionModel().selectedRows()
+        ]
+        self._selection_debounce.start() # Restarts the interval if already pending
 
     @staticmethod
+    @lru_cache(maxsize=8192)
     def format_time(total_seconds): # Only takes total_seconds
-        """Formats seconds into HH:MM:SS."""
+        """Formats seconds into HH:MM:SS. Memoized: the same durations repeat constantly."""
         total_seconds = abs(int(total_seconds))
+        if total_seconds < 3600: # Common case for timers: no division at all
+            return "00:" + _MMSS[total_seconds]
         h, rem = divmod(total_seconds, 3600)
-        m, s = divmod(rem, 60)
-        return f"{h:02}:{m:02}:{s:02}"
+        if h < 100:
+            return _PAD2[h] + ":" + _MMSS[rem]
+        return f"{h:02}:{_MMSS[rem]}"
     
     def update_ui_for_selection(self):
         """Updates buttons and status bar based on current selection."""
@@ -3750,15 +4399,18 @@ class MainWindow(QMainWindow):
         # --- Обновление состояния кнопок ---
         # (Эта логика остается такой же, как и раньше, управляя self.start_tasks_button, 
         # self.start_countdowns_button, self.manage_entries_button и т.д.)
-        work_timers_active = any(not task.get('is_countdown', False) for task in self.active_timer_windows.values())
-        countdown_timers_active = any(task.get('is_countdown', False) for task in self.active_timer_windows.values())
+        # Один проход по активным таймерам вместо двух any()
+        work_timers_active = countdown_timers_active = False
+        for task in self.active_timer_windows.values():
+            if task.get('is_countdown', False): countdown_timers_active = True
+            else: work_timers_active = True
         
         self.start_tasks_button.setEnabled(is_any_selection and not countdown_timers_active)
         
         avg_duration_for_countdown_check = 0
         if is_single_selection:
             # Для кнопки countdown нужна средняя *длительность записи*, а не сессии
-            avg_duration_for_countdown_check = self.db_manager.calculate_average_duration(self.selected_activity_details[0][0])
+            avg_duration_for_countdown_check = self.db_manager.get_average_entry_duration(self.selected_activity_details[0][0])
         
         can_start_countdown = is_single_selection and avg_duration_for_countdown_check > 0 and not work_timers_active
         self.start_countdowns_button.setEnabled(can_start_countdown)
@@ -3791,14 +4443,11 @@ class MainWindow(QMainWindow):
 
         qtimer_was_running = self.qtimer.isActive()
         num_added = 0
-        default_font = self.activity_tree.font() # Get default font once
-        bold_font = QFont(default_font)
-        bold_font.setBold(True)
 
         for activity_id, activity_name in self.selected_activity_details:
             if activity_id not in self.active_timer_windows:
                 print(f"Starting timer for: {activity_name} ({activity_id})")
-                task_start_time = time.time()
+                task_start_time = time.time() # Wall clock: stored as session_id
                 color = self._get_next_multitask_color()
                 new_timer = TimerWindow(initial_color=color, parent=self)
 
@@ -3810,7 +4459,7 @@ class MainWindow(QMainWindow):
                 self.active_timer_windows[activity_id] = {
                     'window': new_timer,
                     'state': TimerWindow.STATE_TRACKING,
-                    'current_interval_start_time': task_start_time,
+                    'current_interval_start_ns': time.monotonic_ns(), # Monotonic: immune to wall-clock jumps
                     'total_session_work_sec': 0,      # For live display in TimerWindow
                     'total_session_break_sec': 0,     # For live display in TimerWindow
                     'session_id': task_start_time,
@@ -3820,9 +4469,7 @@ class MainWindow(QMainWindow):
                 }
                 new_timer.showTrackingState("00:00:00", "00:00:00", activity_name)
 
-                item_ref = self._find_tree_item_by_id(activity_id)
-                if item_ref:
-                    item_ref.setFont(0, bold_font)
+                self._activity_model.set_active(activity_id, True)
 
                 # Calculate window_index based on only non-countdown timers currently active just before adding this one
                 window_index = sum(1 for task in self.active_timer_windows.values() if not task.get('is_countdown', False) and task['window'] is not new_timer)
@@ -3852,19 +4499,16 @@ class MainWindow(QMainWindow):
 
         qtimer_was_running = self.qtimer.isActive()
         num_added = 0
-        default_font = self.activity_tree.font() # Get default font once
-        bold_font = QFont(default_font)
-        bold_font.setBold(True)
 
         for activity_id, activity_name in self.selected_activity_details:
             if activity_id not in self.active_timer_windows:
                 # Check if average duration exists for this activity
-                average_duration = self.db_manager.calculate_average_duration(activity_id)
+                average_duration = self.db_manager.get_average_entry_duration(activity_id)
                 if average_duration > 0:
                     target_duration = int(average_duration)
                     print(f"Starting countdown for: {activity_name} ({activity_id}), Target: {target_duration}s")
 
-                    task_start_time = time.time()
+                    task_start_time = time.time() # Wall clock: stored as session_id
                     color = self._get_next_multitask_color()
                     new_timer = TimerWindow(initial_color=color, parent=self)
 
@@ -3877,7 +4521,7 @@ class MainWindow(QMainWindow):
                     self.active_timer_windows[activity_id] = {
                         'window': new_timer,
                         'state': TimerWindow.STATE_TRACKING, # Countdown runs in tracking state
-                        'current_interval_start_time': task_start_time,
+                        'current_interval_start_ns': time.monotonic_ns(),
                         'total_session_work_sec': 0, # For live display (accumulated work time)
                         'total_session_break_sec': 0, # For live display (accumulated break time)
                         'session_id': task_start_time, # Use unique start time as session ID
@@ -3889,9 +4533,7 @@ class MainWindow(QMainWindow):
                     # Initial display shows target time
                     new_timer.showTrackingState(self.format_time(target_duration), "00:00:00", activity_name)
                     new_timer.set_overrun(False) # Ensure overrun is initially false
-                    item_ref = self._find_tree_item_by_id(activity_id)
-                    if item_ref:
-                        item_ref.setFont(0, bold_font)
+                    self._activity_model.set_active(activity_id, True)
 
                     # Calculate window_index based on only countdown timers currently active just before adding this one
                     window_index = sum(1 for task in self.active_timer_windows.values() if task.get('is_countdown', False) and task['window'] is not new_timer)
@@ -3938,7 +4580,7 @@ class MainWindow(QMainWindow):
         self.active_timer_windows[activity_id] = {
             'window': countdown_window,
             'state': TimerWindow.STATE_TRACKING, # Countdown runs in tracking state
-            'current_interval_start_time': session_start_time,
+            'current_interval_start_ns': time.monotonic_ns(),
             'total_session_work_sec': 0, 'total_session_break_sec': 0,
              # Use start time as session ID for DB logging
             'session_id': session_start_time,
@@ -3951,14 +4593,10 @@ class MainWindow(QMainWindow):
         countdown_window.end_requested.connect(lambda checked=False, aid=activity_id: self.handle_end_request(aid))
 
         # Initial display shows target time
-        countdown_window.showTrackingState(self.format_time(None, self.countdown_target_duration), "00:00:00", activity_name)
+        countdown_window.showTrackingState(self.format_time(self.countdown_target_duration), "00:00:00", activity_name)
         countdown_window.set_overrun(False)
 
-        item_ref = self._find_tree_item_by_id(activity_id)
-        if item_ref:
-            bold_font = QFont(self.activity_tree.font())
-            bold_font.setBold(True)
-            item_ref.setFont(0, bold_font)
+        self._activity_model.set_active(activity_id, True)
 
         self.show_and_position_timer_window(countdown_window, 0) # Show countdown window first
         self.update_ui_for_selection() # Update buttons (disables start tasks, changes countdown button)
@@ -3971,8 +4609,8 @@ class MainWindow(QMainWindow):
         if activity_id in self.active_timer_windows:
             task_data = self.active_timer_windows[activity_id]
             if task_data['state'] == TimerWindow.STATE_TRACKING:
-                now = time.time()
-                work_duration = now - task_data['current_interval_start_time']
+                now_ns = time.monotonic_ns()
+                work_duration = (now_ns - task_data['current_interval_start_ns']) / NS_PER_SECOND
                 
                 if work_duration >= 1:
                     task_data['recorded_intervals'].append({
@@ -3985,7 +4623,7 @@ class MainWindow(QMainWindow):
 
                 task_data['total_session_work_sec'] += work_duration 
                 task_data['state'] = TimerWindow.STATE_PAUSED
-                task_data['current_interval_start_time'] = now 
+                task_data['current_interval_start_ns'] = now_ns
                 
                 task_data['window'].showPausedState(
                     self.format_time(0),  # <<< CORRECTED CALL
@@ -4004,8 +4642,8 @@ class MainWindow(QMainWindow):
         if activity_id in self.active_timer_windows:
             task_data = self.active_timer_windows[activity_id]
             if task_data['state'] == TimerWindow.STATE_PAUSED:
-                now = time.time()
-                break_duration = now - task_data['current_interval_start_time']
+                now_ns = time.monotonic_ns()
+                break_duration = (now_ns - task_data['current_interval_start_ns']) / NS_PER_SECOND
 
                 if break_duration >= 1:
                     task_data['recorded_intervals'].append({
@@ -4018,7 +4656,7 @@ class MainWindow(QMainWindow):
 
                 task_data['total_session_break_sec'] += break_duration 
                 task_data['state'] = TimerWindow.STATE_TRACKING
-                task_data['current_interval_start_time'] = now  
+                task_data['current_interval_start_ns'] = now_ns
 
                 if task_data.get('is_countdown', False):
                     target_duration = task_data.get('target_duration', 0)
@@ -4073,7 +4711,7 @@ class MainWindow(QMainWindow):
             # self.update_ui_for_selection() # Это вызывается при остановке последнего таймера
             return
 
-        current_time = time.time()
+        now_ns = time.monotonic_ns()
         active_ids_in_tick = list(self.active_timer_windows.keys())
 
         for activity_id in active_ids_in_tick:  
@@ -4085,9 +4723,17 @@ class MainWindow(QMainWindow):
             window = task_data['window']
             # activity_name = task_data['activity_name'] # Не используется в status_label здесь
 
+            # Работаем с целыми секундами: если с прошлого тика отображаемые значения не изменились
+            # (джиттер QTimer), окно не трогаем - ни форматирования, ни setText, ни перерисовки
+            interval_sec = (now_ns - task_data['current_interval_start_ns']) // NS_PER_SECOND
+            tick_key = (task_data['state'], interval_sec, task_data['activity_name'])
+            if task_data.get('last_rendered_tick') == tick_key:
+                continue
+            task_data['last_rendered_tick'] = tick_key
+
             if task_data['state'] == TimerWindow.STATE_TRACKING:
-                current_interval_sec = current_time - task_data['current_interval_start_time']
-                total_session_sec = task_data['total_session_work_sec'] + current_interval_sec
+                current_interval_sec = interval_sec
+                total_session_sec = int(task_data['total_session_work_sec']) + current_interval_sec
                 
                 # timer_type_str = "Countdown" if task_data.get('is_countdown') else "Work" # Не используется в status_label
                 # display_text_main_ui = "" # Не используется в status_label
@@ -4111,8 +4757,8 @@ class MainWindow(QMainWindow):
                     window.showTrackingState(display_text_main_timer_window, self.format_time(total_session_sec), task_data['activity_name'])
 
             elif task_data['state'] == TimerWindow.STATE_PAUSED:
-                current_break_interval_sec = current_time - task_data['current_interval_start_time']
-                total_break_sec = task_data['total_session_break_sec'] + current_break_interval_sec
+                current_break_interval_sec = interval_sec
+                total_break_sec = int(task_data['total_session_break_sec']) + current_break_interval_sec
                 current_break_str_timer_window = self.format_time(current_break_interval_sec)
                 total_break_str_timer_window = self.format_time(total_break_sec)
                 window.showPausedState(current_break_str_timer_window, total_break_str_timer_window, task_data['activity_name'])
@@ -4127,11 +4773,14 @@ class MainWindow(QMainWindow):
         #    self.qtimer.stop()
         #    self.update_ui_for_selection()
 
-    def stop_single_task(self, activity_id):
+    def stop_single_task(self, activity_id, refresh_ui=True, save_entry=True):
         """
         Stops one task, accumulates its final interval,
         then shows PostSessionReviewDialog.
         Habit logging is handled based on the dialog's outcome via a connected slot.
+        refresh_ui=False lets a caller stopping several tasks refresh the UI once at the end.
+        save_entry=False discards the session (no review dialog, nothing written to the DB),
+        e.g. when the activity itself is being deleted; the TimerWindow is just closed.
         """
         print(f"DEBUG: MainWindow.stop_single_task called for activity ID: {activity_id}")
 
@@ -4163,8 +4812,7 @@ class MainWindow(QMainWindow):
         current_recorded_intervals = list(task_data['recorded_intervals'])
 
         # Accumulate the final active interval
-        now = time.time()
-        last_interval_duration = now - task_data['current_interval_start_time']
+        last_interval_duration = (time.monotonic_ns() - task_data['current_interval_start_ns']) / NS_PER_SECOND
 
         if last_interval_duration >= 1:
             entry_type_to_accumulate = 'work' if task_data['state'] == TimerWindow.STATE_TRACKING else 'break'
@@ -4177,7 +4825,9 @@ class MainWindow(QMainWindow):
             print(f"DEBUG: Final interval < 1s for {activity_id} (duration: {last_interval_duration:.2f}s), not adding to recorded_intervals for review dialog.")
 
         # --- Show PostSessionReviewDialog ---
-        if not current_recorded_intervals:
+        if not save_entry:
+            print(f"-- Session '{activity_name}' (ID: {activity_id}) discarded without review (save_entry=False).")
+        elif not current_recorded_intervals:
             print(f"-- No significant intervals recorded for session '{activity_name}' (ID: {activity_id}). Skipping review dialog.")
             # If no intervals, no review is needed, but we still need to clean up the task.
         else:
@@ -4203,9 +4853,7 @@ class MainWindow(QMainWindow):
             except RuntimeError as e:
                  print(f"DEBUG: Error closing timer window for {activity_id} (may already be closed): {e}")
 
-        item_ref = self._find_tree_item_by_id(activity_id)
-        if item_ref:
-            item_ref.setFont(0, self.activity_tree.font()) # Reset font to default
+        self._activity_model.set_active(activity_id, False) # Reset font to default
 
         # Remove the task from the active list *after* all its data has been processed
         if activity_id in self.active_timer_windows:
@@ -4217,7 +4865,8 @@ class MainWindow(QMainWindow):
             print(f"DEBUG: Task {activity_id} ('{activity_name}') was already removed from active_timer_windows before final pop.")
 
         # Update UI elements (buttons, status bar)
-        self.update_ui_for_selection()
+        if refresh_ui:
+            self.update_ui_for_selection()
 
         # Check if the global QTimer needs to be stopped
         if not self.active_timer_windows:
@@ -4244,7 +4893,8 @@ class MainWindow(QMainWindow):
         ids_to_stop = list(self.active_timer_windows.keys()) 
         for activity_id in ids_to_stop:
             if activity_id in self.active_timer_windows: # Проверяем, что задача все еще активна
-                self.stop_single_task(activity_id) # Это вызовет диалог для каждой задачи
+                # Это вызовет диалог для каждой задачи; UI обновляем один раз после цикла
+                self.stop_single_task(activity_id, refresh_ui=False)
             else:
                 print(f"DEBUG: stop_all_tasks: Task {activity_id} was already removed before its turn.")
         
@@ -4263,13 +4913,6 @@ class MainWindow(QMainWindow):
              self.qtimer.stop()
         self.update_ui_for_selection()
 
-    def format_time(instance_or_none, total_seconds):
-        """Formats seconds into HH:MM:SS."""
-        total_seconds = abs(int(total_seconds))
-        h, rem = divmod(total_seconds, 3600)
-        m, s = divmod(rem, 60)
-        return f"{h:02}:{m:02}:{s:02}"
-
     def _handle_session_review_outcome(self, reviewed_activity_id: int, activity_name: str, session_id: float, saved_entries_details: list):
         print(f"MainWindow: Session review outcome for '{activity_name}' (ID: {reviewed_activity_id}, Session: {session_id}). "
               f"Saved {len(saved_entries_details)} entries.")
@@ -4309,7 +4952,10 @@ class MainWindow(QMainWindow):
         # (This method remains the same)
         timer_window.show()
         try:
-            screen = QApplication.primaryScreen(); sg = screen.availableGeometry()
+            sg = self._screen_geom
+            if sg is None:
+                print("Error positioning timer window: no screen geometry available")
+                return
             tw = timer_window.width(); th = timer_window.height()
             margin = 15; spacing = 5; offset_x = margin
             # Position based on index (simple tiling)
@@ -4321,6 +4967,17 @@ class MainWindow(QMainWindow):
             timer_window.move(QPoint(x, y))
         except Exception as e: print(f"Error positioning timer window: {e}")
 
+    def _on_primary_screen_changed(self, screen):
+        # Taskbar/dock moves change availableGeometry without any screen being added or removed.
+        # Reconnecting after switching back to a screen only adds an idempotent refresh.
+        if screen is not None:
+            screen.availableGeometryChanged.connect(self._refresh_screen_geometry)
+        self._refresh_screen_geometry()
+
+    def _refresh_screen_geometry(self, *_):
+        screen = QApplication.primaryScreen()
+        self._screen_geom = screen.availableGeometry() if screen is not None else None
+
     def _update_main_status_label(self, activity_id=None, activity_name=None, force_text=None):
         """
         Updates the main status label.
@@ -4381,65 +5038,94 @@ class MainWindow(QMainWindow):
     # --- Context Menu Methods (add_activity_action, rename_activity_action, configure_habit_action, delete_activity_action) ---
     # (These remain the same as in the previous version, ensure delete_activity_action calls stop_single_task if deleting a timed activity)
     
-    def show_activity_context_menu(self, position):
-        clicked_item = self.activity_tree.itemAt(position)
-        menu = QMenu(self)
+    def _build_activity_context_menu(self):
+        # Menu and actions are built once; show_activity_context_menu only retitles/hides them
+        self._tree_context_menu = QMenu(self)
+
+        self._ctx_add_top_level_action = QAction(self._icon_add, "Add Top-Level Activity", self)
+        self._ctx_add_top_level_action.setObjectName("addTopLevelAction") # For debugging sender
+        self._ctx_add_top_level_action.triggered.connect(self._context_add_top_level)
+        self._tree_context_menu.addAction(self._ctx_add_top_level_action)
+
+        self._ctx_item_separator = self._tree_context_menu.addSeparator()
+        self._ctx_add_sub_action = QAction(self._icon_add, "Add Sub-Activity", self)
+        self._ctx_add_sub_action.setObjectName("addSubAction")
+        self._ctx_add_sub_action.triggered.connect(self._context_add_sub)
+        self._tree_context_menu.addAction(self._ctx_add_sub_action)
+
+        self._ctx_rename_separator = self._tree_context_menu.addSeparator()
+        self._ctx_rename_action = QAction(self._icon_rename, "Rename", self)
+        self._ctx_rename_action.setObjectName("renameAction")
+        self._ctx_rename_action.triggered.connect(self._context_rename)
+        self._tree_context_menu.addAction(self._ctx_rename_action)
+
+        self._ctx_config_habit_action = QAction(self._icon_configure_habit, "Configure as Habit...", self)
+        self._ctx_config_habit_action.setObjectName("configHabitAction")
+        self._ctx_config_habit_action.triggered.connect(self._context_configure_habit)
+        self._tree_context_menu.addAction(self._ctx_config_habit_action)
+
+        self._ctx_delete_separator = self._tree_context_menu.addSeparator()
+        self._ctx_delete_action = QAction(self._icon_delete, "Delete", self)
+        self._ctx_delete_action.setObjectName("deleteAction")
+        self._ctx_delete_action.triggered.connect(self._context_delete)
+        self._tree_context_menu.addAction(self._ctx_delete_action)
+
+        self._ctx_item_actions = (
+            self._ctx_item_separator, self._ctx_add_sub_action, self._ctx_rename_separator,
+            self._ctx_rename_action, self._ctx_config_habit_action,
+            self._ctx_delete_separator, self._ctx_delete_action,
+        )
 
+    def show_activity_context_menu(self, position):
+        clicked_index = self.activity_tree.indexAt(position)
         selected_id = None
         item_text_for_menu = "selection"
 
-        if clicked_item:
-            item_text_for_menu = clicked_item.text(0)
-            retrieved_data = clicked_item.data(0, Qt.ItemDataRole.UserRole)
-            # This first print is what we saw: UI_DEBUG_CONTEXT_MENU: Clicked Item='[H] 14 hwf + кс', Retrieved UserRole Data='6' (type: <class 'int'>)
-            print(f"UI_DEBUG_CONTEXT_MENU: Clicked Item='{item_text_for_menu}', Retrieved UserRole Data='{retrieved_data}' (type: {type(retrieved_data)})")
-
-            if isinstance(retrieved_data, int):
-                selected_id = retrieved_data # selected_id is now an integer, e.g., 6
-            else:
-                print(f"UI_ERROR_CONTEXT_MENU: UserRole data for item '{item_text_for_menu}' is NOT an integer (it's '{retrieved_data}'). Will not use for operations requiring an ID.")
+        if clicked_index.isValid():
+            item_text_for_menu = clicked_index.data()
+            selected_id = self._activity_model.activity_id(clicked_index)
         else:
             print(f"UI_DEBUG_CONTEXT_MENU: No item at click position {position}. Context menu might be limited.")
 
-        add_top_level_action = QAction(QApplication.style().standardIcon(QStyle.StandardPixmap.SP_FileDialogNewFolder), "Add Top-Level Activity", self)
-        add_top_level_action.setObjectName("addTopLevelAction") # For debugging sender
-        add_top_level_action.triggered.connect(lambda: self.add_activity_action(parent_id=None))
-        menu.addAction(add_top_level_action)
-
-        if clicked_item and selected_id is not None: # This condition should be true if selected_id is 6
-            menu.addSeparator()
-
-            add_sub_action = QAction(QApplication.style().standardIcon(QStyle.StandardPixmap.SP_FileDialogNewFolder), f"Add Sub-Activity to '{item_text_for_menu}'", self)
-            add_sub_action.setObjectName(f"addSubActionFor_{selected_id}") # For debugging sender
+        # Keep the ID, not the index: the row may move or be deleted before a handler runs
+        self._context_menu_activity_id = selected_id
+        has_item = selected_id is not None
+        for action in self._ctx_item_actions:
+            action.setVisible(has_item)
+        if has_item:
+            self._ctx_add_sub_action.setText(f"Add Sub-Activity to '{item_text_for_menu}'")
+            self._ctx_rename_action.setText(f"Rename '{item_text_for_menu}'")
+            self._ctx_config_habit_action.setText(f"Configure '{item_text_for_menu}' as Habit...")
+            self._ctx_delete_action.setText(f"Delete '{item_text_for_menu}'")
+
+        self._tree_context_menu.exec(self.activity_tree.viewport().mapToGlobal(position))
+
+    # triggered(bool) handlers: dedicated slots so the 'checked' argument never leaks into parent_id/overrides
+    def _context_add_top_level(self):
+        self.add_activity_action(parent_id=None)
+
+    def _context_add_sub(self):
+        if self._context_menu_activity_id is not None:
+            self.add_activity_action(parent_id=self._context_menu_activity_id)
+
+    def _context_rename(self):
+        if self._context_menu_activity_id is not None:
+            self.rename_activity_action(activity_id_override=self._context_menu_activity_id)
+
+    def _context_configure_habit(self):
+        if self._context_menu_activity_id is not None:
+            self.configure_habit_action(activity_id_override=self._context_menu_activity_id)
+
+    def _context_delete(self):
+        if self._context_menu_activity_id is not None:
+            self.delete_activity_action(activity_id_override=self._context_menu_activity_id)
+
+    def _resolve_activity_index(self, activity_id_override):
+        """Index of the given activity, or of the tree's current item if no ID is given."""
+        if activity_id_override is not None:
+            return self._activity_model.index_for_id(activity_id_override)
+        return self.activity_tree.currentIndex()
 
-            # --- CRITICAL DEBUG PRINT ---
-            print(f"UI_DEBUG_CONTEXT_MENU_CONNECT: About to connect 'add_sub_action' for selected_id: {selected_id} (type: {type(selected_id)})")
-            # --- END CRITICAL DEBUG PRINT ---
-
-            # Using functools.partial for robust argument binding
-            action_callable = partial(self.add_activity_action, parent_id=selected_id)
-            add_sub_action.triggered.connect(action_callable)
-            menu.addAction(add_sub_action)
-
-            menu.addSeparator()
-            rename_action = QAction(QApplication.style().standardIcon(QStyle.StandardPixmap.SP_FileDialogDetailedView), f"Rename '{item_text_for_menu}'", self)
-            rename_action.setObjectName(f"renameActionFor_{selected_id}")
-            rename_action.triggered.connect(lambda item_to_rename=clicked_item: self.rename_activity_action(item_to_rename_override=item_to_rename))
-            menu.addAction(rename_action)
-
-            config_habit_action = QAction(QIcon.fromTheme("preferences-system", QApplication.style().standardIcon(QStyle.StandardPixmap.SP_FileDialogContentsView)), f"Configure '{item_text_for_menu}' as Habit...", self)
-            config_habit_action.setObjectName(f"configHabitActionFor_{selected_id}")
-            config_habit_action.triggered.connect(lambda item_to_config=clicked_item: self.configure_habit_action(item_to_config_override=item_to_config))
-            menu.addAction(config_habit_action)
-
-            menu.addSeparator()
-            delete_action = QAction(QApplication.style().standardIcon(QStyle.StandardPixmap.SP_TrashIcon), f"Delete '{item_text_for_menu}'", self)
-            delete_action.setObjectName(f"deleteActionFor_{selected_id}")
-            delete_action.triggered.connect(lambda item_to_delete=clicked_item: self.delete_activity_action(item_to_delete_override=item_to_delete))
-            menu.addAction(delete_action)
-
-        menu.exec(self.activity_tree.viewport().mapToGlobal(position))    
-    
     def add_activity_action(self, parent_id=None):
         sender_action = self.sender()
         if sender_action:
@@ -4453,11 +5139,11 @@ class MainWindow(QMainWindow):
         parent_item_found_in_tree = False # Flag to check if parent_id corresponds to a visible tree item
 
         if parent_id is not None: # This means we are trying to add a sub-activity
-            item = self._find_tree_item_by_id(parent_id)
-            if item:
-                parent_name_suffix = f" under '{item.text(0)}'"
+            parent_index = self._activity_model.index_for_id(parent_id)
+            if parent_index.isValid():
+                parent_name_suffix = f" under '{parent_index.data()}'"
                 parent_item_found_in_tree = True
-                print(f"UI_DEBUG_ADD_ACTIVITY_ACTION: For sub-activity, found parent item '{item.text(0)}' in tree with ID: {parent_id}")
+                print(f"UI_DEBUG_ADD_ACTIVITY_ACTION: For sub-activity, found parent item '{parent_index.data()}' in tree with ID: {parent_id}")
             else:
                 parent_name_suffix = f" under a potential parent (ID: {parent_id})"
                 # This is the UI_WARNING you were seeing. It will now be preceded by the SENDER log.
@@ -4474,11 +5160,14 @@ class MainWindow(QMainWindow):
             new_activity_id = self.db_manager.add_activity(activity_name_to_add, parent_id)
 
             if new_activity_id is not None:
-                print(f"UI_INFO_ADD_ACTIVITY_ACTION: Successfully added activity, new ID: {new_activity_id}. Reloading activities.")
-                self.load_activities()
-                new_item = self._find_tree_item_by_id(new_activity_id)
-                if new_item:
-                    self.activity_tree.setCurrentItem(new_item)
+                print(f"UI_INFO_ADD_ACTIVITY_ACTION: Successfully added activity, new ID: {new_activity_id}. Inserting into tree.")
+                new_index = self._activity_model.add_activity(new_activity_id, activity_name_to_add, parent_id)
+                if not new_index.isValid(): # Родителя нет в модели - полная перезагрузка
+                    self.load_activities()
+                    new_index = self._activity_model.index_for_id(new_activity_id)
+                if new_index.isValid():
+                    self.activity_tree.setCurrentIndex(new_index)
+                    self.activity_tree.scrollTo(new_index) # Раскрывает свернутых родителей
                 self.update_ui_for_selection() 
                 self.habits_updated.emit()
             else:
@@ -4488,15 +5177,14 @@ class MainWindow(QMainWindow):
         else: 
             print(f"UI_INFO_ADD_ACTIVITY_ACTION: Add activity cancelled by user.")
 
-    def rename_activity_action(self, item_to_rename_override=None):
-        selected_item = item_to_rename_override if item_to_rename_override else self.activity_tree.currentItem()
-        if not selected_item:
+    def rename_activity_action(self, activity_id_override=None):
+        selected_index = self._resolve_activity_index(activity_id_override)
+        if not selected_index.isValid():
             print("UI_ERROR_RENAME: No item selected or provided for renaming.")
             return
 
-        activity_id = selected_item.data(0, Qt.ItemDataRole.UserRole)
-        current_display_name = selected_item.text(0)
-        current_name = current_display_name.replace("[H] ", "", 1) if current_display_name.startswith("[H] ") else current_display_name
+        activity_id = self._activity_model.activity_id(selected_index)
+        current_name = self._activity_model.activity_name(selected_index)
         db_parent_id = self.db_manager.get_activity_parent_id(activity_id)
 
         new_name, ok = QInputDialog.getText(self, "Rename Activity", "Enter new name:", QLineEdit.EchoMode.Normal, current_name)
@@ -4504,8 +5192,7 @@ class MainWindow(QMainWindow):
 
         if ok and new_name_stripped and new_name_stripped != current_name:
              if self.db_manager.update_activity_name(activity_id, new_name_stripped, db_parent_id):
-                 prefix = "[H] " if current_display_name.startswith("[H] ") else ""
-                 selected_item.setText(0, prefix + new_name_stripped)
+                 self._activity_model.rename_activity(activity_id, new_name_stripped)
                  # Update name in active timer window if it's running
                  if activity_id in self.active_timer_windows:
                      self.active_timer_windows[activity_id]['activity_name'] = new_name_stripped
@@ -4535,57 +5222,37 @@ class MainWindow(QMainWindow):
         elif ok and not new_name_stripped:
              QMessageBox.warning(self, "Error", "Activity name cannot be empty.")
 
-    def configure_habit_action(self, item_to_config_override=None):
-        selected_item = item_to_config_override if item_to_config_override else self.activity_tree.currentItem()
-        if not selected_item:
+    def configure_habit_action(self, activity_id_override=None):
+        selected_index = self._resolve_activity_index(activity_id_override)
+        if not selected_index.isValid():
             print("UI_ERROR_CONFIG_HABIT: No item selected or provided for habit configuration.")
             return
-        activity_id = selected_item.data(0, Qt.ItemDataRole.UserRole)
-        display_name = selected_item.text(0)
-        activity_name = display_name.replace("[H] ", "", 1) if display_name.startswith("[H] ") else display_name
+        activity_id = self._activity_model.activity_id(selected_index)
+        activity_name = self._activity_model.activity_name(selected_index)
         current_config = self.db_manager.get_activity_habit_config(activity_id)
         dialog = ConfigureHabitDialog(activity_id, activity_name, current_config, self.db_manager, self)
         if dialog.exec() == QDialog.DialogCode.Accepted:
-            print(f"Habit config updated for {activity_name}. Reloading activities.")
-            selected_ids_before_reload = {details[0] for details in self.selected_activity_details}
-            self.load_activities() # Reloads tree
-            # Restore selection
-            items_to_select = []
-            iterator = QTreeWidgetItemIterator(self.activity_tree)
-            while iterator.value():
-                item = iterator.value()
-                item_id = item.data(0, Qt.ItemDataRole.UserRole)
-                if item_id in selected_ids_before_reload: items_to_select.append(item)
-                iterator += 1
-            self.activity_tree.blockSignals(True)
-            self.activity_tree.clearSelection()
-            for item in items_to_select: item.setSelected(True)
-            self.activity_tree.blockSignals(False)
-            self.handle_selection_change() # Update UI for restored selection
+            print(f"Habit config updated for {activity_name}. Updating its tree row.")
+            # Только "[H] " префикс этой строки; выделение и раскрытие сохраняются без перезагрузки
+            habit_type, _, _ = self.db_manager.get_activity_habit_config(activity_id)
+            self._activity_model.set_habit_type(activity_id, habit_type)
 
             self.habits_updated.emit() # Notify habit views
 
 
-    def delete_activity_action(self, item_to_delete_override=None): # Keep the fix from previous step here too
-        selected_item = item_to_delete_override if item_to_delete_override else self.activity_tree.currentItem()
-        if not selected_item:
+    def delete_activity_action(self, activity_id_override=None): # Keep the fix from previous step here too
+        selected_index = self._resolve_activity_index(activity_id_override)
+        if not selected_index.isValid():
             print("UI_ERROR_DELETE: No item selected or provided for deletion.")
             return
         
-        activity_id = selected_item.data(0, Qt.ItemDataRole.UserRole)
-        # Ensure activity_id is an integer, especially if coming from item_to_delete_override
-        if not isinstance(activity_id, int):
-            print(f"UI_ERROR_DELETE: Invalid activity ID ({activity_id}) for item '{selected_item.text(0)}'. Cannot delete.")
-            QMessageBox.warning(self, "Error", "Could not delete item: invalid activity ID.")
-            return
-
-        activity_name = selected_item.text(0)
-        base_activity_name = activity_name.replace("[H] ", "", 1) if activity_name.startswith("[H] ") else activity_name
+        activity_id = self._activity_model.activity_id(selected_index)
+        base_activity_name = self._activity_model.activity_name(selected_index)
 
         # Warning message logic
         warning_message = ""
-        all_descendants = self.db_manager.get_descendant_activity_ids(activity_id)
-        descendant_count = len(all_descendants) - 1 if activity_id in all_descendants else len(all_descendants)
+        # Только количество (COUNT в SQL, кэшируется); сами ID нужны лишь после подтверждения
+        descendant_count = self.db_manager.get_descendant_count(activity_id)
         if descendant_count > 0:
             warning_message += f"\n\nWARNING: Also deletes {descendant_count} child activities!"
         warning_message += "\nAll associated time/habit entries will also be deleted!"
@@ -4604,7 +5271,8 @@ class MainWindow(QMainWindow):
                 self.stop_single_task(activity_id, save_entry=False)
 
             if self.db_manager.delete_activity(activity_id):
-                self.load_activities()
+                # Убираем только удаленную ветку, без полной перезагрузки дерева
+                self._activity_model.remove_activity(activity_id)
                 if is_habit:
                     self.habits_updated.emit()
             else:
@@ -4680,12 +5348,7 @@ class MainWindow(QMainWindow):
             proceed_with_instance_value = True
 
         elif habit_type == HABIT_TYPE_PERCENTAGE:
-            logs_for_day_temp = self.db_manager.get_habit_logs_for_date_range(today_str, today_str)
-            current_cumulative_value_for_prompt = None
-            for (log_aid, log_date), log_val in logs_for_day_temp.items():
-                if log_aid == activity_id and log_date == today_str:
-                    current_cumulative_value_for_prompt = log_val
-                    break
+            current_cumulative_value_for_prompt = self.db_manager.get_habit_log_value(activity_id, today_str)
             current_total_percentage_for_display = current_cumulative_value_for_prompt if current_cumulative_value_for_prompt is not None else 0.0
             
             prompt_title = f"Log Percentage for '{activity_name}' Instance" # Use activity_name
@@ -4701,12 +5364,7 @@ class MainWindow(QMainWindow):
                 proceed_with_instance_value = True
 
         elif habit_type == HABIT_TYPE_NUMERIC:
-            logs_for_day_temp = self.db_manager.get_habit_logs_for_date_range(today_str, today_str)
-            current_cumulative_value_for_prompt = None
-            for (log_aid, log_date), log_val in logs_for_day_temp.items():
-                if log_aid == activity_id and log_date == today_str:
-                    current_cumulative_value_for_prompt = log_val
-                    break
+            current_cumulative_value_for_prompt = self.db_manager.get_habit_log_value(activity_id, today_str)
             current_total_numeric_for_display = current_cumulative_value_for_prompt if current_cumulative_value_for_prompt is not None else 0.0
             
             unit_display = f" ({habit_unit})" if habit_unit else ""
@@ -4728,12 +5386,7 @@ class MainWindow(QMainWindow):
                 proceed_with_instance_value = True
         
         if proceed_with_instance_value and value_this_instance is not None:
-            logs_for_day = self.db_manager.get_habit_logs_for_date_range(today_str, today_str)
-            current_cumulative_value_db = None
-            for (log_aid, log_date), log_val in logs_for_day.items():
-                if log_aid == activity_id and log_date == today_str:
-                    current_cumulative_value_db = log_val
-                    break
+            current_cumulative_value_db = self.db_manager.get_habit_log_value(activity_id, today_str)
             
             new_daily_total = None
 
@@ -4803,6 +5456,7 @@ class MainWindow(QMainWindow):
 
 # --- Application Launch ---
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(message)s") # DEBUG here brings back the DB trace output
     # Improve rendering on HiDPI displays (optional)
     if hasattr(Qt.ApplicationAttribute, 'AA_EnableHighDpiScaling'):
         QApplication.setAttribute(Qt.ApplicationAttribute.AA_EnableHighDpiScaling, True)
@@ -4813,29 +5467,3 @@ if __name__ == '__main__':
     main_win = MainWindow()
     main_win.show()
     sys.exit(app.exec())
-
-# --- End of Modified MainWindow Class ---
-
-# (Rest of the code: DatabaseManager, other Widgets, Dialogs, Model, Delegate, __main__ remains the same)
-
-# ... (Keep all other classes as they were) ...
-
-# --- Application Launch ---
-if __name__ == '__main__':
-    # ... (High DPI settings) ...
-    app = QApplication(sys.argv)
-    main_win = MainWindow()
-    main_win.show()
-    sys.exit(app.exec())
-# --- Application Launch ---
-if __name__ == '__main__':
-    # Improve rendering on HiDPI displays (optional)
-    if hasattr(Qt.ApplicationAttribute, 'AA_EnableHighDpiScaling'):
-        QApplication.setAttribute(Qt.ApplicationAttribute.AA_EnableHighDpiScaling, True)
-    if hasattr(Qt.ApplicationAttribute, 'AA_UseHighDpiPixmaps'):
-        QApplication.setAttribute(Qt.ApplicationAttribute.AA_UseHighDpiPixmaps, True)
-
-    app = QApplication(sys.argv)
-    main_win = MainWindow()
-    main_win.show()
-    sys.exit(app.exec())
\ No newline at end of file